@@ -0,0 +1,196 @@
+# Read-only JSON API over todo.db for the PWA and its service worker.
+#
+#   python api.py --port 8502
+#   curl -i http://127.0.0.1:8502/api/tasks/pending?limit=50
+#
+# GET /api/tasks/pending     pending tasks, soonest deadline first
+# GET /api/tasks/completed   completed tasks, newest first (?verdict=...)
+#
+# Both take ?limit= and ?after=, the "next" token of the previous page.
+# Timestamps are epoch seconds; nothing in a response depends on the time
+# it was made, so it stays valid until the tasks table changes. The ETag is
+# the table's change counter (storage._migrate_change_counters): a poll
+# sending the ETag back in If-None-Match costs one primary key lookup and
+# gets 304 while nothing changed. Responses are marked no-cache, so the
+# browser cache and the service worker's stale-while-revalidate copy are
+# always revalidated that way.
+#
+# The app and the API are separate processes on the same database. Put the
+# API behind the app's origin (a reverse proxy mounting it at /api/) or set
+# TODO_API_URL for assets.py to its absolute URL; CORS is allowed for reads.
+import argparse
+import base64
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import storage
+import tasks
+
+API_HOST = os.environ.get("TODO_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("TODO_API_PORT", "8502"))
+
+# Largest page a client may ask for
+MAX_LIMIT = 200
+
+PENDING_FIELDS = ["id", "title", "description", "created_at", "deadline", "version"]
+COMPLETED_FIELDS = [
+    "id", "title", "description", "created_at", "deadline", "completed_at",
+    "verification_result", "verdict", "confidence", "version",
+]
+
+
+class BadRequest(Exception):
+    pass
+
+
+def encode_cursor(cursor):
+    # Opaque page token for a (sort value, id) cursor
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise BadRequest("invalid 'after' token")
+    if not isinstance(row_id, int) or not (value is None or isinstance(value, int)):
+        raise BadRequest("invalid 'after' token")
+    return value, row_id
+
+
+def etag(counter):
+    return f'"tasks-{counter}"'
+
+
+def etag_matches(header, tag):
+    # If-None-Match holds "*" or a list of tags, possibly weak (W/"...")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+def _page_params(query):
+    try:
+        limit = int(query.get("limit", [tasks.PAGE_SIZE])[0])
+    except ValueError:
+        raise BadRequest("'limit' must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"'limit' must be between 1 and {MAX_LIMIT}")
+    return decode_cursor(query.get("after", [None])[0]), limit
+
+
+def _records(rows, fields):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def read_pending(conn, query):
+    after, limit = _page_params(query)
+    rows, cursor = tasks.pending_records(conn, after, limit)
+    return {"tasks": _records(rows, PENDING_FIELDS), "next": encode_cursor(cursor)}
+
+
+def read_completed(conn, query):
+    after, limit = _page_params(query)
+    verdict = query.get("verdict", [None])[0]
+    rows, cursor = tasks.completed_records(conn, after, limit, verdict=verdict)
+    return {"tasks": _records(rows, COMPLETED_FIELDS), "next": encode_cursor(cursor)}
+
+
+ROUTES = {
+    "/api/tasks/pending": read_pending,
+    "/api/tasks/completed": read_completed,
+}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=()):
+        data = b"" if body is None else json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Expose-Headers", "ETag")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_OPTIONS(self):
+        # CORS preflight for clients that set If-None-Match themselves
+        self._send(204, headers=[
+            ("Access-Control-Allow-Methods", "GET"),
+            ("Access-Control-Allow-Headers", "If-None-Match"),
+            ("Access-Control-Max-Age", "86400"),
+        ])
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        route = ROUTES.get(url.path.rstrip("/"))
+        if route is None:
+            self._send(404, {"error": "not found"})
+            return
+
+        # Connection pool attached by make_server()
+        pool = self.server.pool
+        with pool.connection() as conn:
+            tag = etag(tasks.change_counter(conn))
+            if etag_matches(self.headers.get("If-None-Match"), tag):
+                self._send(304, headers=[("ETag", tag), ("Cache-Control", "no-cache")])
+                return
+
+            # Read the counter again inside one read transaction with the
+            # rows, so the ETag sent describes exactly this body
+            conn.execute("BEGIN")
+            try:
+                tag = etag(tasks.change_counter(conn))
+                body = route(conn, parse_qs(url.query))
+            except BadRequest as exc:
+                self._send(400, {"error": str(exc)})
+                return
+            finally:
+                conn.rollback()
+
+        self._send(200, body, headers=[("ETag", tag), ("Cache-Control", "no-cache")])
+
+
+def make_server(host=API_HOST, port=API_PORT, pool=None):
+    # port=0 picks a free port; read it back from server.server_address
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.pool = pool or storage.ConnectionPool()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the task database")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Task API on http://{args.host}:{server.server_address[1]}/api/tasks/pending, "
+          f"reading {server.pool.path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.pool.close()
+
+
+if __name__ == "__main__":
+    main()
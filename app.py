@@ -1,143 +1,356 @@
 import streamlit as st
-import sqlite3
 import os
-import shutil
+import time
+import uuid
 import json
+import tempfile
 from datetime import datetime
-from groq import Groq
-import base64
-from io import BytesIO
-from PIL import Image
-from pathlib import Path
+
+import assets
+import backends
+import bulk
+import evidence
+import metrics
+import tasks
+import triage
+import jobs
+import reminders
+from verifier import VERIFIED, Verification, parse_verification, stream_stats, stream_verification, verify_batch
+from verify_cache import VerificationCache
+from images import preprocess_stats
 
 # Setup database
-# Setup database
-def init_db():
-    conn = sqlite3.connect('todo.db')
-    c = conn.cursor()
-    
-    # Check if the table exists
-    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='tasks'")
-    table_exists = c.fetchone() is not None
-    
-    if not table_exists:
-        # Create the table with all columns
-        c.execute('''
-        CREATE TABLE tasks (
-            id INTEGER PRIMARY KEY,
-            title TEXT,
-            description TEXT,
-            created_at TIMESTAMP,
-            deadline TIMESTAMP,
-            completed_at TIMESTAMP,
-            status TEXT,
-            verification_result TEXT
-        )
-        ''')
+# One storage backend per process, chosen with TODO_STORAGE_BACKEND.
+# Streamlit keeps cached resources across reruns and sessions, so schema
+# migrations run once per database.
+@st.cache_resource
+def get_backend():
+    with metrics.span("init_db"):
+        return backends.make_backend()
+
+# The tenant whose database this session uses; always the default one
+# unless the backend is sharded
+def current_tenant():
+    return get_backend().tenant_for(st.context.headers)
+
+def get_pool():
+    return get_backend().pool(current_tenant())
+
+# Runs fn(conn, *args) as one write for the current session and commits it
+def write(fn, *args, **kwargs):
+    return get_backend().write(current_tenant(), fn, *args, **kwargs)
+
+# Services below are per tenant, for as many tenants as the sharded backend
+# keeps open; with the other backends there is only the default tenant
+
+# Verdicts are cached process-wide and persisted alongside the tasks
+@st.cache_resource(max_entries=backends.OPEN_SHARDS)
+def get_verification_cache(tenant):
+    return VerificationCache(get_backend().pool(tenant))
+
+# On-disk store of evidence photos and their renditions
+@st.cache_resource
+def get_evidence_store():
+    return evidence.EvidenceStore()
+
+# Deadline reminders are sent from this process; the sink is chosen with
+# REMINDER_SINK
+@st.cache_resource(max_entries=backends.OPEN_SHARDS, on_release=lambda scheduler: scheduler.stop(timeout=0))
+def get_reminder_scheduler(tenant):
+    return reminders.ReminderScheduler(get_backend().pool(tenant)).start()
+
+# Background workers that run queued verifications for this process
+@st.cache_resource(max_entries=backends.OPEN_SHARDS, on_release=lambda worker: worker.stop(timeout=0))
+def get_verification_worker(tenant):
+    return jobs.VerificationWorker(get_backend().pool(tenant), cache=get_verification_cache(tenant)).start()
+
+def confidence_str(confidence):
+    return f" ({confidence:.0%} confidence)" if confidence is not None else ""
+
+# Success or warning box for a verdict; `container` is st or a placeholder
+def show_verdict(container, verification, title=None):
+    subject = f"**{title}**" if title else "Task"
+    confidence = confidence_str(verification.confidence)
+    if verification.verdict == VERIFIED:
+        container.success(f"🎉 {subject} verified as complete!{confidence}")
     else:
-        # Check if deadline column exists
-        c.execute("PRAGMA table_info(tasks)")
-        columns = [column[1] for column in c.fetchall()]
-        
-        # Add the deadline column if it doesn't exist
-        if 'deadline' not in columns:
-            c.execute("ALTER TABLE tasks ADD COLUMN deadline TIMESTAMP")
-    
-    conn.commit()
-    return conn
-
-# Groq Llama API setup
-def verify_task_completion(image_bytes, task_description):
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-    
-    # Convert image bytes to base64 for API
-    base64_image = base64.b64encode(image_bytes).decode('utf-8')
-    
-    # Create a message with the Groq Llama Vision API
-    # Note: Llama 3.2 doesn't support system messages with image inputs
-    chat_completion = client.chat.completions.create(
-        model="llama-3.2-11b-vision-preview",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text", 
-                        "text": f"You are a task verification assistant. Your job is to verify if the uploaded image shows evidence that the described task has been completed. Be strict but fair in your assessment.\n\nDoes this image show evidence that the following task has been completed? Task: {task_description}\n\nPlease respond with either 'VERIFIED' if the image clearly shows the task has been completed, or 'NOT VERIFIED' if the evidence is insufficient or unclear. Then briefly explain your reasoning."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}",
-                        },
-                    },
-                ],
-            }
-        ]
-    )
+        container.warning(f"{subject} marked as completed, but verification had some concerns.{confidence}")
+
+# How often the Complete Task page checks on a queued verification
+JOB_POLL_SECONDS = 2
+
+# Completed-tab filter choices
+VERDICT_FILTERS = {None: "All", "verified": "Verified", "not_verified": "With concerns"}
+
+# Pending tasks offered for selection in batch mode
+BATCH_CHOICES = 100
+
+# Exports larger than this are spooled to disk before download
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+
+def show_verification_result(job):
+    status, attempts, result, error, submitted_at, deadline_ts = job
+    
+    if status == "failed":
+        st.error(f"Verification failed after {attempts} attempts; the task is back in your pending list. ({error})")
+        return
+    
+    verification = parse_verification(result)
     
-    return chat_completion.choices[0].message.content
+    # Display results
+    show_verdict(st, verification)
+    
+    # Show deadline status, judged at submission time
+    if deadline_ts is not None:
+        time_diff = abs(deadline_ts - submitted_at) / 3600
+        if submitted_at <= deadline_ts:
+            st.success(f"✅ Completed on time! ({time_diff:.1f} hours before deadline)")
+        else:
+            st.error(f"⚠️ Completed {time_diff:.1f} hours after deadline")
+    
+    st.write("**Verification Details:**")
+    st.write(verification.reason)
 
-# Setup PWA files
-def setup_pwa():
-    # Create directories for static files
-    static_dir = Path("static")
-    icons_dir = static_dir / "icons"
+# Polls a queued job without rerunning the rest of the page; once it
+# finishes, a full rerun renders the result and refreshes the task list
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_verification_job(job_id):
+    with get_pool().connection() as conn:
+        job = jobs.get_job(conn, job_id)
     
-    # Create directories if they don't exist
-    static_dir.mkdir(exist_ok=True)
-    icons_dir.mkdir(exist_ok=True)
+    if job[0] in ("done", "failed"):
+        st.rerun()
     
-    # Copy manifest.json to static directory
-    manifest_path = Path("manifest.json")
-    if manifest_path.exists():
-        shutil.copy(manifest_path, static_dir / "manifest.json")
+    if job[0] == "queued" and job[1] > 0:
+        st.info(f"⏳ Verification attempt {job[1]} hit a temporary error; retrying shortly...")
     else:
-        # Create manifest.json if it doesn't exist
-        manifest = {
-            "name": "Photo-Verified Todo App",
-            "short_name": "Todo Verify",
-            "description": "A Todo app that verifies task completion with photos",
-            "start_url": "/",
-            "display": "standalone",
-            "background_color": "#ffffff",
-            "theme_color": "#4CAF50",
-            "icons": [
-                {
-                    "src": "icons/icon-192x192.png",
-                    "sizes": "192x192",
-                    "type": "image/png"
-                },
-                {
-                    "src": "icons/icon-512x512.png",
-                    "sizes": "512x512",
-                    "type": "image/png"
-                }
-            ]
-        }
-        with open(static_dir / "manifest.json", "w") as f:
-            json.dump(manifest, f)
-    
-    # Copy service-worker.js to static directory
-    sw_path = Path("service-worker.js")
-    if sw_path.exists():
-        shutil.copy(sw_path, static_dir / "service-worker.js")
-    
-    # Generate a sample icon if none exists
-    icon_file = icons_dir / "icon-192x192.png"
-    if not icon_file.exists():
-        # Create a simple colored square as icon (in a real app, use proper icons)
-        img = Image.new('RGB', (192, 192), color=(76, 175, 80))
-        img.save(icon_file)
+        st.info("⏳ Analyzing your evidence with Llama 3.2...")
+
+# Keyset pagination controls. Each list keeps a stack of page cursors in
+# session state so "Previous" can step back without rereading from the start.
+def page_cursor(key):
+    return st.session_state.get(f"{key}_cursors", [None])[-1]
+
+def page_controls(key, next_cursor):
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    prev_col, next_col = st.columns(2)
+    
+    # The cursor stack is updated in the button callbacks, which run before
+    # the list's fragment reruns, so no extra rerun is needed
+    if len(cursors) > 1:
+        prev_col.button("← Previous", key=f"{key}_prev", on_click=cursors.pop)
+    
+    if next_cursor is not None:
+        next_col.button("Next →", key=f"{key}_next", on_click=cursors.append, args=(next_cursor,))
+
+# Label, colour and remaining-time text for a pending row. Cached on
+# (tenant, task id, row version, minute) so a row is only formatted again
+# when the task changes or the clock moves on; `_row` is not part of the
+# key. Task ids restart in every shard, hence the tenant.
+@st.cache_data(max_entries=2000)
+def pending_row_display(tenant, task_id, version, minute, _row):
+    task_title, bucket, seconds_remaining = _row
+    
+    # The urgency bucket is computed by the query
+    if bucket == "none":
+        return f"📌 {task_title} (No deadline)", "No deadline set", "gray"
+    
+    hours_remaining = seconds_remaining / 3600
+    if bucket == "overdue":
+        return f"🚨 OVERDUE: {task_title}", f"**OVERDUE by {abs(hours_remaining):.1f} hours!**", "red"
+    if bucket == "urgent":
+        return f"⚠️ URGENT: {task_title}", f"**{hours_remaining*60:.0f} minutes remaining!**", "orange"
+    if bucket == "today":
+        return f"⏰ {task_title}", f"**{hours_remaining:.1f} hours remaining**", "blue"
+    days = hours_remaining / 24
+    return f"📌 {task_title}", f"{days:.1f} days remaining", "green"
+
+# Triage statistics for an uploaded photo, keyed on its sha256 (the
+# evidence store's photo id) so reruns with the same upload do not decode
+# it again; `_image_bytes` is not part of the key
+@st.cache_data(max_entries=256)
+def inspect_photo(photo_id, _image_bytes):
+    return triage.inspect(_image_bytes)
+
+# Expander label, deadline text, timing line and verdict line for a
+# completed row; nothing here depends on the clock. Keyed like
+# pending_row_display.
+@st.cache_data(max_entries=2000)
+def completed_row_display(tenant, task_id, version, _row):
+    title, deadline, verdict, confidence, on_time, seconds_late = _row
+    
+    # On-time flag is computed by the query; NULL when either timestamp is
+    # missing
+    if deadline is None:
+        deadline_str = "No deadline set"
+        deadline_label = "✅ "
+    else:
+        deadline_str = deadline
+        if on_time is None:
+            deadline_label = "✅ "
+        else:
+            deadline_label = "✅ ON TIME: " if on_time else "⚠️ LATE: "
+    
+    timing_str = None
+    if seconds_late is not None:
+        time_diff = seconds_late / 3600
+        if time_diff <= 0:
+            timing_str = f"**Completed {abs(time_diff):.1f} hours before deadline**"
+        else:
+            timing_str = f"**Completed {time_diff:.1f} hours after deadline**"
+    
+    verdict_str = None
+    if verdict is not None:
+        verdict_str = "✅ Verified" if verdict == VERIFIED else "⚠️ Concerns"
+        verdict_str = f"**Verdict:** {verdict_str}{confidence_str(confidence)}"
+    
+    return f"{deadline_label}{title}", deadline_str, timing_str, verdict_str
+
+# The two task lists are fragments: paging, filtering and other widgets in
+# a list rerun only that list, with a connection of its own, instead of the
+# whole script. Each run builds widgets for one page of tasks.
+@st.fragment
+def pending_list():
+    # Rows are computed for the start of the current minute so they match
+    # the cached display strings
+    minute = tasks.now_epoch() // 60
+    tenant = current_tenant()
+    with get_pool().connection() as conn, metrics.span("query.pending"):
+        pending_tasks, next_cursor = tasks.pending_page(conn, after=page_cursor("pending"), now=minute * 60)
+    
+    if not pending_tasks:
+        st.info("No pending tasks. Add some tasks to get started!")
+    
+    with metrics.span("render.pending"):
+        for task in pending_tasks:
+            task_id, task_title, task_desc, created, deadline_ts, deadline, bucket, seconds_remaining, version = task
+            expander_label, time_str, time_color = pending_row_display(
+                tenant, task_id, version, minute, (task_title, bucket, seconds_remaining)
+            )
+            
+            with st.expander(expander_label):
+                st.write(f"**Description:** {task_desc}")
+                st.write(f"**Created:** {created}")
+                st.write(f"**Deadline:** {deadline}")
+                st.markdown(f"<span style='color:{time_color};'>{time_str}</span>", unsafe_allow_html=True)
+                
+                # Add hidden element for notifications to find
+                if bucket in ("urgent", "today"):
+                    # Epoch milliseconds, which `new Date()` accepts directly
+                    task_info = {
+                        "id": task_id,
+                        "title": task_title,
+                        "deadline": deadline_ts * 1000
+                    }
+                    st.markdown(
+                        f'<div id="urgent-task-{task_id}" data-task-info=\'{json.dumps(task_info)}\'></div>',
+                        unsafe_allow_html=True
+                    )
+                
+                st.write("Status: Pending verification")
+                
+                # Switching pages needs a full rerun, not just this fragment
+                if st.button("Complete task now", key=f"quick_complete_{task_id}"):
+                    st.session_state["complete_task_id"] = task_id
+                    st.session_state["page"] = "Complete Task"
+                    st.rerun()
+    
+    page_controls("pending", next_cursor)
+
+@st.fragment
+def completed_list():
+    tenant = current_tenant()
+    with get_pool().connection() as conn:
+        # Totals are kept by triggers in verdict_counts; filtering is served
+        # by idx_tasks_verdict
+        counts = tasks.verdict_counts(conn)
+        verified_col, concerns_col = st.columns(2)
+        verified_col.metric("Verified", counts.get("verified", 0))
+        concerns_col.metric("With concerns", counts.get("not_verified", 0))
         
-        # Create a larger icon as well
-        img_large = Image.new('RGB', (512, 512), color=(76, 175, 80))
-        img_large.save(icons_dir / "icon-512x512.png")
+        verdict_filter = st.radio(
+            "Show", [None, "verified", "not_verified"], horizontal=True,
+            format_func=lambda verdict: VERDICT_FILTERS[verdict], key="verdict_filter",
+            on_change=lambda: st.session_state.pop("completed_cursors", None)
+        )
+        with metrics.span("query.completed"):
+            completed_tasks, next_cursor = tasks.completed_page(
+                conn, after=page_cursor("completed"), verdict=verdict_filter
+            )
+            photos = evidence.latest_for_tasks(conn, [task[0] for task in completed_tasks])
+    
+    if not completed_tasks:
+        st.info("No completed tasks yet. Complete some tasks to see them here!")
+    
+    with metrics.span("render.completed"):
+        for task in completed_tasks:
+            task_id, title, desc, deadline, completed, verification, verdict, confidence, on_time, seconds_late, version = task
+            label, deadline_str, timing_str, verdict_str = completed_row_display(
+                tenant, task_id, version, (title, deadline, verdict, confidence, on_time, seconds_late)
+            )
+            
+            with st.expander(label):
+                st.write(f"**Description:** {desc}")
+                st.write(f"**Deadline:** {deadline_str}")
+                st.write(f"**Completed:** {completed}")
+                if timing_str is not None:
+                    st.write(timing_str)
+                if verdict_str is not None:
+                    st.write(verdict_str)
+                st.write(f"**Verification:** {verification}")
+                
+                # Thumbnails are read from the evidence store's memory maps;
+                # a store directory that was moved or pruned just hides them
+                if task_id in photos:
+                    try:
+                        st.image(get_evidence_store().read(photos[task_id], evidence.THUMB), caption="Evidence")
+                    except FileNotFoundError:
+                        st.caption("Evidence photo unavailable")
+    
+    page_controls("completed", next_cursor)
 
-def main():
-    # Setup PWA files
-    setup_pwa()
+# Build the PWA assets once per process; the build only writes files whose
+# content changed. The template is kept in memory for later reruns.
+@st.cache_resource
+def get_pwa_assets():
+    with metrics.span("setup_pwa"):
+        urls = assets.build()["urls"]
+        return urls, assets.render_template(urls)
+
+# Opt-in sidebar panel with this rerun's spans and DB counters; only offered
+# when instrumentation is enabled (TODO_METRICS=1)
+def render_debug_panel(request):
+    if request is None or not st.sidebar.toggle("Performance debug panel", key="debug_panel"):
+        return
     
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption(f"Request {request.id} · session {request.session_id}")
+        elapsed = time.time() - request.started
+        st.write(f"**Rerun so far:** {elapsed * 1000:.1f} ms")
+        st.write(f"**DB:** {request.db_queries} queries, {request.db_rows} rows")
+        for name, seconds in request.spans:
+            st.write(f"`{name}` {seconds * 1000:.1f} ms")
+        
+        previous = [r for r in metrics.registry.recent if r.session_id == request.session_id]
+        if previous:
+            last = previous[-1]
+            st.caption(
+                f"Previous rerun: {last.duration * 1000:.1f} ms, "
+                f"{last.db_queries} queries, {last.db_rows} rows"
+            )
+
+def main():
+    # Correlates this rerun's spans with the browser session
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex[:12]
+    request = metrics.begin_request(st.session_state["session_id"])
+    try:
+        run_page()
+    finally:
+        render_debug_panel(request)
+        metrics.end_request()
+
+def run_page():
     st.set_page_config(
         page_title="Photo-Verified Todo App",
         page_icon="✅",
@@ -145,43 +358,248 @@ def main():
     )
     
     # Add custom HTML for PWA
-    with open("pwa_template.html", "r") as f:
-        pwa_html = f.read()
-        st.markdown(
-            f"""
-            <script>
-                // This is injected into the Streamlit app to enable PWA features
-                document.addEventListener('DOMContentLoaded', (event) => {{
-                    const linkElement = document.createElement('link');
-                    linkElement.rel = 'manifest';
-                    linkElement.href = '/static/manifest.json';
-                    document.head.appendChild(linkElement);
-                    
-                    // Register service worker
-                    if ('serviceWorker' in navigator) {{
-                        navigator.serviceWorker.register('/static/service-worker.js')
-                            .then(reg => console.log('Service Worker registered', reg))
-                            .catch(err => console.error('Service Worker registration failed', err));
-                    }}
-                }});
-            </script>
-            """,
-            unsafe_allow_html=True
-        )
+    asset_urls, pwa_html = get_pwa_assets()
+    st.markdown(
+        f"""
+        <script>
+            // This is injected into the Streamlit app to enable PWA features
+            document.addEventListener('DOMContentLoaded', (event) => {{
+                const linkElement = document.createElement('link');
+                linkElement.rel = 'manifest';
+                linkElement.href = '{asset_urls["manifest.json"]}';
+                document.head.appendChild(linkElement);
+                
+                // Register service worker
+                if ('serviceWorker' in navigator) {{
+                    navigator.serviceWorker.register('{asset_urls["service-worker.js"]}')
+                        .then(reg => console.log('Service Worker registered', reg))
+                        .catch(err => console.error('Service Worker registration failed', err));
+                }}
+            }});
+        </script>
+        """,
+        unsafe_allow_html=True
+    )
     
     # Check for API key
     if not os.environ.get("GROQ_API_KEY"):
         st.error("Please set your GROQ_API_KEY environment variable to use this app.")
         st.stop()
     
-    # Initialize database
-    conn = init_db()
+    # Start the background verification workers once per process and
+    # tenant
+    tenant = current_tenant()
+    get_verification_worker(tenant)
+    scheduler = get_reminder_scheduler(tenant)
     
+    # Borrow a pooled connection for the reads of this script run; writes
+    # go through write(). A model call the page asks for runs once the
+    # connection is back in the pool, so sessions waiting on the model do
+    # not starve everyone else of connections.
+    with get_pool().connection() as conn:
+        verify = render_page(conn, scheduler)
+    if verify is not None:
+        verify()
+
+# Live mode: stream the model's answer into the page. The task is completed
+# as soon as the opening tokens settle the verdict; the full explanation is
+# stored once the stream ends, and if the stream breaks off the task goes
+# back to pending.
+def render_live_verification(task_id, task_description, deadline_ts, image_bytes):
+    now = tasks.now_epoch()
+    verdict_box = st.empty()
+    st.write("**Verification Details:**")
+    text_box = st.empty()
+    
+    text = ""
+    completed = False
+    try:
+        for kind, value in stream_verification(image_bytes, task_description, cache=get_verification_cache(current_tenant())):
+            if kind == "verdict":
+                # Confidence and explanation follow once the stream ends
+                write(tasks.complete_task, task_id, None, completed_at=now, verdict=value, commit=False)
+                completed = True
+                show_verdict(verdict_box, Verification(value, None, ""))
+            elif kind == "text":
+                text_box.markdown(value + " ▌")
+            else:
+                text, timings = value
+    except Exception as exc:
+        if completed:
+            write(tasks.reopen_task, task_id, commit=False)
+            verdict_box.empty()
+        st.error(f"Verification failed, task left pending. ({exc})")
+        return
+    
+    verification = parse_verification(text)
+    show_verdict(verdict_box, verification)
+    text_box.markdown(verification.reason)
+    write(
+        tasks.complete_task, task_id, verification.reason, completed_at=now,
+        verdict=verification.verdict, confidence=verification.confidence, commit=False
+    )
+    
+    if deadline_ts is not None:
+        time_diff = abs(deadline_ts - now) / 3600
+        if now <= deadline_ts:
+            st.success(f"✅ Completed on time! ({time_diff:.1f} hours before deadline)")
+        else:
+            st.error(f"⚠️ Completed {time_diff:.1f} hours after deadline")
+    
+    if timings["ttft"] is not None:
+        st.caption(
+            f"First token after {timings['ttft']:.2f}s, verdict after {timings['time_to_verdict']:.2f}s"
+        )
+
+# Batch mode: several (task, photo) pairs verified concurrently, with every
+# completion written in a single transaction. The page is screened here;
+# the model call is returned for run_page to make once the page's
+# connection is released.
+def render_batch_completion(conn, scheduler):
+    pending_tasks = tasks.pending_choices(conn, limit=BATCH_CHOICES)
+    
+    if not pending_tasks:
+        st.info("No pending tasks. Add some tasks first!")
+        return
+    
+    selected = st.multiselect(
+        "Select tasks to complete",
+        pending_tasks,
+        format_func=lambda task: task[1]
+    )
+    
+    ready = []
+    for task_id, title in selected:
+        uploaded_file = st.file_uploader(
+            f"Photo evidence for '{title}'", type=["jpg", "jpeg", "png"], key=f"batch_upload_{task_id}"
+        )
+        if uploaded_file is not None:
+            ready.append((task_id, title, uploaded_file.getvalue()))
+    
+    if not st.button(f"Submit {len(ready)} tasks for Verification", disabled=not ready):
+        return
+    
+    # Every task in the batch is judged against the same submission time
+    now = tasks.now_epoch()
+    details = [tasks.get_task(conn, task_id, now=now) for task_id, _, _ in ready]
+    
+    # Photos are triaged and linked to their tasks in one write. Each is
+    # triaged after the previous one is indexed, so a photo reused within
+    # the batch is caught too; only the rest go to the model.
+    store = get_evidence_store()
+    photo_ids = [store.ingest(image_bytes) for _, _, image_bytes in ready]
+    
+    # Photos are decoded before the write, not while it holds the lock
+    inspected = [inspect_photo(photo_id, image_bytes) for (_, _, image_bytes), photo_id in zip(ready, photo_ids)]
+    
+    def screen(conn):
+        screenings = []
+        for (task_id, _, image_bytes), photo_id, stats in zip(ready, photo_ids, inspected):
+            screening = triage.screen(conn, stats, task_id)
+            evidence_id = evidence.attach(conn, task_id, photo_id, len(image_bytes), now=now)
+            triage.remember(conn, evidence_id, screening)
+            screenings.append(screening)
+        return screenings
+    
+    verifications = []
+    for screening in write(screen):
+        triage.record(screening)
+        verifications.append(screening.verification)
+    
+    return lambda: finish_batch(scheduler, ready, details, verifications, now)
+
+def finish_batch(scheduler, ready, details, verifications, now):
+    remote = [index for index, verification in enumerate(verifications) if verification is None]
+    if remote:
+        with st.spinner(f"Analyzing evidence for {len(remote)} tasks with Llama 3.2..."):
+            results = verify_batch(
+                [(ready[index][2], details[index][0]) for index in remote],
+                cache=get_verification_cache(current_tenant())
+            )
+        for index, result in zip(remote, results):
+            verifications[index] = result if isinstance(result, Exception) else parse_verification(result)
+    write(tasks.complete_tasks, [
+        (task_id, verification.reason, now, verification.verdict, verification.confidence)
+        for (task_id, _, _), verification in zip(ready, verifications)
+        if not isinstance(verification, Exception)
+    ], commit=False)
+    
+    for (task_id, title, _), task, verification in zip(ready, details, verifications):
+        deadline_ts = task[1]
+        if isinstance(verification, Exception):
+            st.error(f"**{title}**: verification failed, task left pending. ({verification})")
+            continue
+        
+        scheduler.cancel(task_id)
+        show_verdict(st, verification, title=title)
+        
+        if deadline_ts is not None:
+            time_diff = abs(deadline_ts - now) / 3600
+            if now <= deadline_ts:
+                st.caption(f"✅ Completed on time! ({time_diff:.1f} hours before deadline)")
+            else:
+                st.caption(f"⚠️ Completed {time_diff:.1f} hours after deadline")
+        
+        with st.expander("Verification Details"):
+            st.write(verification.reason)
+
+def export_file(pool, fmt, status):
+    # Built only when the download is clicked. Rows are streamed from the
+    # cursor into a temporary file, kept in memory only while it is small,
+    # and read back as the bytes Streamlit serves; it takes no file objects
+    # other than its own in-memory and opened-file types.
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as spool:
+        text = bulk.text_stream(spool, fmt, encoding="utf-8")
+        with pool.connection() as conn:
+            bulk.export_tasks(conn, text, fmt, status)
+        text.flush()
+        text.detach().seek(0)
+        return spool.read()
+
+def render_import_export(conn, scheduler):
+    st.subheader("Import tasks")
+    st.caption(
+        "CSV with a header row, or JSON lines, with title, description and deadline "
+        "(ISO 8601 or epoch seconds). Exports can be imported again."
+    )
+    uploaded_file = st.file_uploader("Task file", type=["csv", "jsonl"], key="import_file")
+    allow_past = st.checkbox("Accept pending tasks whose deadline has passed")
+    if uploaded_file is not None and st.button("Import tasks"):
+        fmt = bulk.format_for(uploaded_file.name)
+        with st.spinner("Importing..."):
+            report = write(
+                bulk.import_tasks, bulk.text_stream(uploaded_file, fmt), fmt, allow_past=allow_past, commit=False
+            )
+        # The scheduler picks imported tasks up on its next poll
+        scheduler.notify()
+        st.success(
+            f"Imported {report.imported} tasks in {report.seconds:.2f}s "
+            f"({bulk.rows_per_second(report):,.0f} rows/s)."
+        )
+        if report.skipped:
+            st.warning(f"Skipped {report.skipped} invalid rows.")
+            with st.expander("Rejected rows"):
+                for line_number, message in report.errors:
+                    st.write(f"Line {line_number}: {message}")
+    
+    st.subheader("Export tasks")
+    fmt = st.radio("Format", bulk.FORMATS, horizontal=True, key="export_format")
+    status = st.selectbox("Tasks", ["All", "Pending", "Completed"], key="export_status")
+    status = None if status == "All" else status.lower()
+    st.download_button(
+        "Download",
+        data=lambda pool=get_pool(): export_file(pool, fmt, status),
+        file_name=f"tasks.{fmt}",
+        mime="text/csv" if fmt == "csv" else "application/x-ndjson",
+        on_click="ignore"
+    )
+
+def render_page(conn, scheduler):
     st.title("📸 Photo-Verified Todo App")
     st.write("Complete tasks and provide photo evidence for verification!")
     
     # Navigation
-    page = st.sidebar.radio("Navigation", ["Add Task", "View Tasks", "Complete Task"])
+    page = st.sidebar.radio("Navigation", ["Add Task", "View Tasks", "Complete Task", "Import / Export"])
     
     # Initialize session state
     if "complete_task_id" not in st.session_state:
@@ -217,12 +635,8 @@ def main():
                 if time_remaining <= 0:
                     st.error("Cannot create task with a deadline in the past. Please choose a future deadline.")
                 else:
-                    c = conn.cursor()
-                    c.execute(
-                        "INSERT INTO tasks (title, description, created_at, deadline, status) VALUES (?, ?, ?, ?, ?)",
-                        (title, description, datetime.now(), deadline, "pending")
-                    )
-                    conn.commit()
+                    task_id = write(tasks.add_task, title, description, int(deadline.timestamp()), commit=False)
+                    scheduler.schedule(task_id, int(deadline.timestamp()))
                     st.success(f"Task '{title}' added successfully!")
     
     elif page == "View Tasks":
@@ -232,202 +646,93 @@ def main():
         tab1, tab2 = st.tabs(["Pending Tasks", "Completed Tasks"])
         
         with tab1:
-            c = conn.cursor()
-            c.execute("SELECT id, title, description, created_at, deadline FROM tasks WHERE status='pending' ORDER BY deadline ASC")
-            pending_tasks = c.fetchall()
-            
-            if not pending_tasks:
-                st.info("No pending tasks. Add some tasks to get started!")
-            
-            now = datetime.now()
-            
-            for task in pending_tasks:
-                task_id, task_title, task_desc, created, deadline = task
-                
-                # Calculate time remaining
-                now = datetime.now()
-                
-                # Handle NULL or missing deadline values
-                if deadline is None:
-                    # For tasks without deadlines, set a default
-                    expander_label = f"📌 {task_title} (No deadline)"
-                    time_str = "No deadline set"
-                    time_color = "gray"
-                else:
-                    try:
-                        if isinstance(deadline, str):
-                            deadline_dt = datetime.fromisoformat(deadline)
-                        else:
-                            deadline_dt = deadline
-                            
-                        remaining = deadline_dt - now
-                        hours_remaining = remaining.total_seconds() / 3600
-                        
-                        # Style based on time remaining
-                        if hours_remaining < 0:
-                            expander_label = f"🚨 OVERDUE: {task_title}"
-                            time_str = f"**OVERDUE by {abs(hours_remaining):.1f} hours!**"
-                            time_color = "red"
-                        elif hours_remaining < 1:
-                            expander_label = f"⚠️ URGENT: {task_title}"
-                            time_str = f"**{hours_remaining*60:.0f} minutes remaining!**"
-                            time_color = "orange"
-                        elif hours_remaining < 24:
-                            expander_label = f"⏰ {task_title}"
-                            time_str = f"**{hours_remaining:.1f} hours remaining**"
-                            time_color = "blue"
-                        else:
-                            expander_label = f"📌 {task_title}"
-                            days = hours_remaining / 24
-                            time_str = f"{days:.1f} days remaining"
-                            time_color = "green"
-                    except (ValueError, TypeError):
-                        # Handle invalid datetime format
-                        expander_label = f"📌 {task_title}"
-                        time_str = "Invalid deadline format"
-                        time_color = "gray"
-                        hours_remaining = 999  # Just a large value for logic below
-            
-            with st.expander(expander_label):
-                st.write(f"**Description:** {task_desc}")
-                st.write(f"**Created:** {created}")
-                st.write(f"**Deadline:** {deadline}")
-                st.markdown(f"<span style='color:{time_color};'>{time_str}</span>", unsafe_allow_html=True)
-                
-                # Add hidden element for notifications to find
-                if hours_remaining < 24 and hours_remaining > 0:
-                    task_info = {
-                        "id": task_id,
-                        "title": task_title,
-                        "deadline": str(deadline)
-                    }
-                    st.markdown(
-                        f'<div id="urgent-task-{task_id}" data-task-info=\'{json.dumps(task_info)}\'></div>',
-                        unsafe_allow_html=True
-                    )
-                
-                st.write("Status: Pending verification")
-                
-                # Add quick complete button
-                if st.button(f"Complete task now", key=f"quick_complete_{task_id}"):
-                    st.session_state["complete_task_id"] = task_id
-                    st.session_state["page"] = "Complete Task"
-                    st.experimental_rerun()
+            pending_list()
         
         with tab2:
-            c = conn.cursor()
-            c.execute("SELECT id, title, description, deadline, completed_at, verification_result FROM tasks WHERE status='completed' ORDER BY completed_at DESC")
-            completed_tasks = c.fetchall()
-            
-            if not completed_tasks:
-                st.info("No completed tasks yet. Complete some tasks to see them here!")
-            
-            for task in completed_tasks:
-                task_id, title, desc, deadline, completed, verification = task
-                
-                # Handle NULL or invalid deadline format
-                if deadline is None:
-                    deadline_met = True  # No deadline means always on time
-                    deadline_str = "No deadline set"
-                    deadline_label = "✅ "
-                else:
-                    try:
-                        if isinstance(deadline, str):
-                            deadline_dt = datetime.fromisoformat(deadline)
-                        else:
-                            deadline_dt = deadline
-                            
-                        if isinstance(completed, str):
-                            completed_dt = datetime.fromisoformat(completed)
-                        else:
-                            completed_dt = completed
-                            
-                        deadline_met = completed_dt <= deadline_dt
-                        deadline_str = str(deadline)
-                        deadline_label = "✅ ON TIME: " if deadline_met else "⚠️ LATE: "
-                    except (ValueError, TypeError):
-                        deadline_met = True  # Invalid format means we can't tell
-                        deadline_str = "Invalid deadline format"
-                        deadline_label = "✅ "
-                
-                with st.expander(f"{deadline_label}{title}"):
-                    st.write(f"**Description:** {desc}")
-                    st.write(f"**Deadline:** {deadline_str}")
-                    st.write(f"**Completed:** {completed}")
-                    
-                    # Calculate time diff if possible
-                    if deadline is not None and completed is not None:
-                        try:
-                            if isinstance(deadline, str):
-                                deadline_dt = datetime.fromisoformat(deadline)
-                            else:
-                                deadline_dt = deadline
-                                
-                            if isinstance(completed, str):
-                                completed_dt = datetime.fromisoformat(completed)
-                            else:
-                                completed_dt = completed
-                                
-                            time_diff = (completed_dt - deadline_dt).total_seconds() / 3600
-                            if time_diff <= 0:
-                                st.write(f"**Completed {abs(time_diff):.1f} hours before deadline**")
-                            else:
-                                st.write(f"**Completed {time_diff:.1f} hours after deadline**")
-                        except (ValueError, TypeError):
-                            st.write("**Time difference calculation unavailable**")
-                    
-                    st.write(f"**Verification:** {verification}")
+            completed_list()
     
     elif page == "Complete Task":
         st.header("Complete a Task")
         
+        cache_stats = get_verification_cache(current_tenant()).stats()
+        st.sidebar.caption(
+            f"Verification cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses, {cache_stats['entries']} entries"
+        )
+        live_stats = stream_stats()
+        if live_stats["streams"]:
+            st.sidebar.caption(
+                f"Live verifications: {live_stats['streams']}, average first token "
+                f"{live_stats['avg_ttft']:.2f}s, average verdict {live_stats['avg_time_to_verdict']:.2f}s"
+            )
+        screened = triage.triage_stats()
+        if screened["checked"]:
+            st.sidebar.caption(
+                f"Photo triage: {screened['checked']} checked, {screened['avoided']} model calls avoided "
+                f"({screened['rejected']} unusable, {screened['reused']} reused)"
+            )
+        image_stats = preprocess_stats()
+        if image_stats["images"]:
+            st.sidebar.caption(
+                f"Image uploads: {image_stats['images']} images, "
+                f"{image_stats['bytes_before'] / 1024:.0f} KB → {image_stats['bytes_after'] / 1024:.0f} KB"
+            )
+        
+        # Progress or outcome of the last submitted verification
+        job_id = st.session_state.get("verification_job_id")
+        if job_id is not None:
+            job = jobs.get_job(conn, job_id)
+            if job is None:
+                st.session_state["verification_job_id"] = None
+            elif job[0] in ("done", "failed"):
+                show_verification_result(job)
+                st.session_state["verification_job_id"] = None
+            else:
+                poll_verification_job(job_id)
+            st.divider()
+        
+        mode = st.radio("Mode", ["Single task", "Batch"], horizontal=True)
+        if mode == "Batch":
+            return render_batch_completion(conn, scheduler)
+        
         # If we have a selected task from a button click
         preselected_task_id = st.session_state.get("complete_task_id")
         
-        c = conn.cursor()
-        c.execute("SELECT id, title FROM tasks WHERE status='pending'")
-        pending_tasks = c.fetchall()
+        # Only the soonest-due page of tasks, or the newest matches for the
+        # search box, is offered, plus the task the user picked from the
+        # task list if it falls outside that page
+        search = st.text_input("Search tasks", placeholder="Words from the title or description", key="task_search")
+        with metrics.span("query.choices"):
+            pending_tasks = tasks.pending_choices(conn, include_id=preselected_task_id, search=search)
         
         if not pending_tasks:
-            st.info("No pending tasks. Add some tasks first!")
+            if search.strip():
+                st.info(f"No pending tasks match '{search}'.")
+            else:
+                st.info("No pending tasks. Add some tasks first!")
             st.stop()
         
-        task_options = {task[1]: task[0] for task in pending_tasks}
-        
-        # If we have a preselected task, get its title
-        preselected_title = None
-        if preselected_task_id:
-            for title, task_id in task_options.items():
-                if task_id == preselected_task_id:
-                    preselected_title = title
-                    break
-        
-        selected_task_title = st.selectbox(
+        # Options are (id, title) pairs so tasks sharing a title stay distinct
+        task_ids = [task[0] for task in pending_tasks]
+        selected_task_id, _ = st.selectbox(
             "Select a task to complete", 
-            list(task_options.keys()),
-            index=list(task_options.keys()).index(preselected_title) if preselected_title else 0
+            pending_tasks,
+            index=task_ids.index(preselected_task_id) if preselected_task_id in task_ids else 0,
+            format_func=lambda task: task[1]
         )
-        selected_task_id = task_options[selected_task_title]
         
         # Clear the session state
         st.session_state["complete_task_id"] = None
         
         # Get task details
-        c.execute("SELECT description, deadline FROM tasks WHERE id=?", (selected_task_id,))
-        task_data = c.fetchone()
-        task_description = task_data[0]
-        
-        # Handle case where deadline might be NULL for existing tasks
-        task_deadline = task_data[1] if task_data[1] else datetime.now().isoformat()
+        task_description, deadline_ts, task_deadline, seconds_remaining = tasks.get_task(conn, selected_task_id)
         
-        # Calculate time remaining
-        now = datetime.now()
-        try:
-            deadline_dt = datetime.fromisoformat(task_deadline)
-            time_remaining = (deadline_dt - now).total_seconds() / 3600
-        except (ValueError, TypeError):
-            # Handle case where deadline might be in wrong format
+        # Tasks from before deadlines existed have none; treat them as due now
+        if deadline_ts is None:
+            task_deadline = "No deadline set"
             time_remaining = 0
+        else:
+            time_remaining = seconds_remaining / 3600
         
         st.write(f"**Task Description:** {task_description}")
         
@@ -442,66 +747,62 @@ def main():
         uploaded_file = st.file_uploader("Upload photo evidence", type=["jpg", "jpeg", "png"])
         
         if uploaded_file is not None:
-            # Display the uploaded image
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Evidence", use_column_width=True)
+            # The photo is stored and resized once; reruns show the stored
+            # display-size rendition instead of decoding the upload again
+            image_bytes = uploaded_file.getvalue()
+            store = get_evidence_store()
+            with metrics.span("image.decode"):
+                photo_id = store.ingest(image_bytes)
+            st.image(store.read(photo_id, evidence.DISPLAY), caption="Uploaded Evidence", use_column_width=True)
+            
+            # Unusable or reused photos are answered locally
+            screening = triage.screen(conn, inspect_photo(photo_id, image_bytes), selected_task_id)
+            if screening.verification is not None:
+                st.warning(f"{screening.verification.reason} It will be marked as not verified without calling the model.")
+            
+            live = st.toggle(
+                "Stream the verification live",
+                help="Wait on this page and watch the model's answer arrive instead of verifying in the background"
+            )
             
             if st.button("Submit for Verification"):
-                with st.spinner("Analyzing your evidence with Llama 3.2..."):
-                    # Reset file pointer
-                    uploaded_file.seek(0)
-                    image_bytes = uploaded_file.getvalue()
-                    
-                    # Verify using Claude
-                    verification_result = verify_task_completion(image_bytes, task_description)
-                    
-                    # Get current deadline for comparison
-                    c.execute("SELECT deadline FROM tasks WHERE id=?", (selected_task_id,))
-                    deadline_data = c.fetchone()[0]
-                    
-                    now = datetime.now()
-                    
-                    # Handle cases where deadline might be NULL or invalid
-                    if deadline_data is None:
-                        deadline_met = True  # If no deadline, consider it met
-                    else:
-                        try:
-                            if isinstance(deadline_data, str):
-                                deadline = datetime.fromisoformat(deadline_data)
-                            else:
-                                deadline = deadline_data
-                            deadline_met = now <= deadline
-                        except (ValueError, TypeError):
-                            deadline_met = True  # If deadline format is invalid, consider it met
-                    
-                    # Update the task status
-                    c = conn.cursor()
-                    c.execute(
-                        "UPDATE tasks SET status=?, completed_at=?, verification_result=? WHERE id=?",
-                        ("completed", now, verification_result, selected_task_id)
+                # The photo is linked in the same write as the local
+                # completion or the queued job; live verification completes
+                # the task once the model answers
+                def submit(conn):
+                    evidence_id = evidence.attach(conn, selected_task_id, photo_id, len(image_bytes))
+                    triage.remember(conn, evidence_id, screening)
+                    if screening.verification is not None:
+                        tasks.complete_task(
+                            conn, selected_task_id, screening.verification.reason,
+                            verdict=screening.verification.verdict, commit=False
+                        )
+                    elif not live:
+                        return jobs.enqueue(conn, selected_task_id, task_description, image_bytes, commit=False)
+                
+                job_id = write(submit)
+                triage.record(screening)
+                # No more reminders once the task is handed in
+                scheduler.cancel(selected_task_id)
+                
+                if screening.verification is not None:
+                    show_verdict(st, screening.verification)
+                    st.stop()
+                
+                if live:
+                    return lambda: render_live_verification(
+                        selected_task_id, task_description, deadline_ts, image_bytes
                     )
-                    conn.commit()
-                    
-                    # Display results
-                    if "VERIFIED" in verification_result:
-                        st.success("🎉 Task verified as complete!")
-                    else:
-                        st.warning("Task marked as completed, but verification had some concerns.")
-                    
-                    # Show deadline status
-                    if deadline_data is not None:
-                        try:
-                            if deadline_met:
-                                time_diff = (deadline - now).total_seconds() / 3600
-                                st.success(f"✅ Completed on time! ({abs(time_diff):.1f} hours before deadline)")
-                            else:
-                                time_diff = (now - deadline).total_seconds() / 3600
-                                st.error(f"⚠️ Completed {time_diff:.1f} hours after deadline")
-                        except (ValueError, TypeError, NameError):
-                            st.info("Deadline information unavailable")
-                    
-                    st.write("**Verification Details:**")
-                    st.write(verification_result)
+                
+                # Hand the verification to the background workers and return
+                # straight away; the job panel above polls for the outcome
+                st.session_state["verification_job_id"] = job_id
+                get_verification_worker(current_tenant()).notify()
+                st.rerun()
+    
+    elif page == "Import / Export":
+        st.header("Import and Export")
+        render_import_export(conn, scheduler)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,172 @@
+# PWA asset build.
+#
+#   python assets.py            # build into ./static and print the asset map
+#
+# Writes the manifest, icons and scripts into static/ under content-hashed
+# names (manifest.3f2a9c1d0e.json) so browsers can cache them forever, and
+# only touches files whose content changed. The service worker keeps its
+# stable URL, as browsers require for updates, and is generated with the
+# fingerprinted precache list and a cache name derived from the build, so
+# any asset change ships a new worker that drops the old cache.
+#
+# The app runs build() once per process through st.cache_resource.
+import hashlib
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+
+STATIC_DIR = Path("static")
+STATIC_URL = "/static/"
+
+MANIFEST_SOURCE = Path("manifest.json")
+SERVICE_WORKER_SOURCE = Path("service-worker.js")
+NOTIFICATION_SOURCE = STATIC_DIR / "notification.js"
+TEMPLATE_SOURCE = Path("pwa_template.html")
+
+# Written when manifest.json is missing
+DEFAULT_MANIFEST = {
+    "name": "Photo-Verified Todo App",
+    "short_name": "Todo Verify",
+    "description": "A Todo app that verifies task completion with photos",
+    "start_url": "/",
+    "display": "standalone",
+    "background_color": "#ffffff",
+    "theme_color": "#4CAF50",
+    "icons": [
+        {"src": "icons/icon-192x192.png", "sizes": "192x192", "type": "image/png"},
+        {"src": "icons/icon-512x512.png", "sizes": "512x512", "type": "image/png"},
+    ],
+}
+
+ICON_COLOR = (76, 175, 80)
+
+# Where the service worker finds the task API (api.py): a path on the app's
+# origin behind a reverse proxy, or an absolute URL
+API_URL = os.environ.get("TODO_API_URL", "/api/")
+
+# Placeholders in service-worker.js
+PRECACHE_PLACEHOLDER = "[/* __PRECACHE_URLS__ */]"
+BUILD_PLACEHOLDER = "__BUILD_HASH__"
+API_PLACEHOLDER = "__API_URL__"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def fingerprint(name, data):
+    path = Path(name)
+    return str(path.with_name(f"{path.stem}.{content_hash(data)}{path.suffix}"))
+
+
+def _write_if_changed(path, data):
+    # Returns True when the file was (re)written
+    if path.exists() and path.read_bytes() == data:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return True
+
+
+def _prune(directory, stem, suffix, keep):
+    # Remove earlier fingerprinted builds of the same asset
+    for old in directory.glob(f"{stem}.*{suffix}"):
+        if old.name != keep and len(old.name.split(".")) == 3:
+            old.unlink()
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def _icon_png(size):
+    # A flat square in the theme colour; deterministic so its hash is stable.
+    # Encoded by hand so building the assets does not load Pillow at startup.
+    row = b"\x00" + bytes(ICON_COLOR) * size
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+        + _png_chunk(b"IDAT", zlib.compress(row * size, 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def _emit(static_dir, name, data, written):
+    # Write `data` under its fingerprinted name; returns the static-relative path
+    hashed = fingerprint(name, data)
+    target = static_dir / hashed
+    if _write_if_changed(target, data):
+        written.append(hashed)
+    _prune(target.parent, Path(name).stem, Path(name).suffix, target.name)
+    return hashed
+
+
+def build(static_dir=STATIC_DIR):
+    # Returns {logical name: URL} for every emitted asset, plus the list of
+    # files that had to be written under "written"
+    static_dir = Path(static_dir)
+    written = []
+    urls = {}
+
+    if MANIFEST_SOURCE.exists():
+        manifest = json.loads(MANIFEST_SOURCE.read_text())
+    else:
+        manifest = DEFAULT_MANIFEST
+
+    # Every icon size the manifest declares, which is also what the service
+    # worker precaches
+    icons = []
+    for icon in manifest.get("icons", []):
+        size = int(icon["sizes"].split("x")[0])
+        logical = f"icons/icon-{size}x{size}.png"
+        hashed = _emit(static_dir, logical, _icon_png(size), written)
+        urls[logical] = STATIC_URL + hashed
+        icons.append(dict(icon, src=hashed))
+
+    manifest = dict(manifest, icons=icons)
+    manifest_data = json.dumps(manifest, indent=2, sort_keys=True).encode()
+    urls["manifest.json"] = STATIC_URL + _emit(static_dir, "manifest.json", manifest_data, written)
+
+    if NOTIFICATION_SOURCE.exists():
+        urls["notification.js"] = STATIC_URL + _emit(
+            static_dir, "notification.js", NOTIFICATION_SOURCE.read_bytes(), written
+        )
+
+    if SERVICE_WORKER_SOURCE.exists():
+        precache = ["/"] + sorted(urls.values())
+        build_hash = content_hash(json.dumps(precache).encode())
+        worker = (
+            SERVICE_WORKER_SOURCE.read_text()
+            .replace(PRECACHE_PLACEHOLDER, json.dumps(precache, indent=2))
+            .replace(BUILD_PLACEHOLDER, build_hash)
+            .replace(API_PLACEHOLDER, API_URL.rstrip("/") + "/")
+        )
+        # Notification icons are referenced by their logical names
+        for logical, url in urls.items():
+            worker = worker.replace(f"'{logical}'", f"'{url}'")
+        if _write_if_changed(static_dir / "service-worker.js", worker.encode()):
+            written.append("service-worker.js")
+        urls["service-worker.js"] = STATIC_URL + "service-worker.js"
+
+    _write_if_changed(
+        static_dir / "asset-manifest.json",
+        json.dumps(urls, indent=2, sort_keys=True).encode()
+    )
+    return {"urls": urls, "written": written}
+
+
+def render_template(urls):
+    # pwa_template.html with its static references pointed at the
+    # fingerprinted assets; read once by the caller and kept in memory
+    html = TEMPLATE_SOURCE.read_text()
+    for logical, url in urls.items():
+        html = html.replace(f"{STATIC_URL}{logical}", url)
+    return html
+
+
+if __name__ == "__main__":
+    result = build()
+    print(json.dumps(result["urls"], indent=2))
+    print(f"{len(result['written'])} files written: {', '.join(result['written']) or 'none'}")
@@ -0,0 +1,235 @@
+# Storage backends: where a session's tasks live and how its writes reach
+# SQLite.
+#
+#   TODO_STORAGE_BACKEND=sharded streamlit run app.py
+#
+# single   one database (TODO_DB_PATH) shared by everyone; every write
+#          commits on its own. The default, and what the app always did.
+# sharded  one database per tenant under SHARD_DIR, so tenants never wait
+#          on each other's write locks. Pools for the OPEN_SHARDS most
+#          recently used tenants are kept open. The tenant comes from the
+#          TENANT_HEADER request header, which a trusted reverse proxy must
+#          set (and strip from client requests).
+# queue    one database, with every write handed to a single writer thread
+#          that runs whatever has queued up in one transaction, so a burst
+#          of sessions costs one commit instead of one each.
+#
+# Reads borrow connections from pool(tenant). Writes go through
+# write(tenant, fn, *args): fn(conn, *args) runs the statements and must not
+# commit; the backend commits and returns fn's result, or raises its
+# exception. Several server processes may share a database with either
+# backend; they still take turns on SQLite's write lock, waiting up to
+# storage.BUSY_TIMEOUT_MS.
+import hashlib
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+import storage
+
+BACKEND = os.environ.get("TODO_STORAGE_BACKEND", "single")
+
+# Sharded backend: database directory, pools kept open, connections per
+# pool
+SHARD_DIR = os.environ.get("TODO_SHARD_DIR", "shards")
+OPEN_SHARDS = int(os.environ.get("TODO_OPEN_SHARDS", "32"))
+SHARD_POOL_SIZE = int(os.environ.get("TODO_SHARD_POOL_SIZE", "4"))
+
+# Request header naming the tenant, and the tenant used without one
+TENANT_HEADER = os.environ.get("TODO_TENANT_HEADER", "X-Forwarded-User")
+DEFAULT_TENANT = "default"
+
+# Writes applied per transaction by the queue backend
+WRITE_BATCH = int(os.environ.get("TODO_WRITE_BATCH", "256"))
+
+# Tenant names matching this are used as file names as they are; others
+# (emails with "+", display names with spaces) are hashed
+TENANT_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.@-]{0,63}")
+
+
+def _write_now(pool, fn, args, kwargs):
+    # The write lock is taken up front, so a write never fails half way
+    # trying to upgrade from a read
+    with pool.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn, *args, **kwargs)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+
+class SingleBackend:
+
+    def __init__(self, path=storage.DB_PATH):
+        self._pool = storage.ConnectionPool(path)
+
+    def tenant_for(self, headers):
+        return DEFAULT_TENANT
+
+    def pool(self, tenant=DEFAULT_TENANT):
+        return self._pool
+
+    def write(self, tenant, fn, *args, **kwargs):
+        return _write_now(self._pool, fn, args, kwargs)
+
+    def close(self):
+        self._pool.close()
+
+
+class ShardedBackend:
+
+    def __init__(self, root=SHARD_DIR, open_shards=OPEN_SHARDS, pool_size=SHARD_POOL_SIZE):
+        self.root = Path(root)
+        self.open_shards = open_shards
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def tenant_for(self, headers):
+        tenant = (headers.get(TENANT_HEADER) or "").strip()
+        return tenant or DEFAULT_TENANT
+
+    def path(self, tenant):
+        # A hashed name starts with "_", which no plain name can, so the two
+        # never collide
+        if TENANT_NAME.fullmatch(tenant):
+            name = tenant
+        else:
+            name = "_" + hashlib.sha256(tenant.encode()).hexdigest()[:32]
+        return self.root / f"{name}.db"
+
+    def pool(self, tenant=DEFAULT_TENANT):
+        with self._lock:
+            pool = self._pools.get(tenant)
+            if pool is not None:
+                self._pools.move_to_end(tenant)
+                return pool
+
+        # Opened outside the lock, so other tenants are not held up; when
+        # two threads open the same shard at once the first pool stored wins
+        opened = storage.ConnectionPool(str(self.path(tenant)), size=self.pool_size)
+        with self._lock:
+            pool = self._pools.setdefault(tenant, opened)
+            self._pools.move_to_end(tenant)
+            while len(self._pools) > self.open_shards:
+                # Not closed here, as its connections may be in use; they
+                # close when the last borrower lets go of the pool
+                self._pools.popitem(last=False)
+        if pool is not opened:
+            opened.close()
+        return pool
+
+    def write(self, tenant, fn, *args, **kwargs):
+        return _write_now(self.pool(tenant), fn, args, kwargs)
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+class WriteQueueBackend:
+
+    def __init__(self, path=storage.DB_PATH, batch_size=WRITE_BATCH):
+        self._pool = storage.ConnectionPool(path)
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def tenant_for(self, headers):
+        return DEFAULT_TENANT
+
+    def pool(self, tenant=DEFAULT_TENANT):
+        return self._pool
+
+    def write(self, tenant, fn, *args, **kwargs):
+        # Blocks until the batch holding this write has committed
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future.result()
+
+    def _apply(self, conn, batch):
+        # One transaction for the whole batch, a savepoint per write so a
+        # failing write is undone without losing the others
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for _, fn, args, kwargs in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((True, fn(conn, *args, **kwargs)))
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((False, exc))
+                conn.execute("RELEASE write")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return outcomes
+
+    def _run(self):
+        # A dedicated connection: the pool's are left to readers
+        conn = storage.connect(self.path)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Everything that queued up while the last batch committed
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+            try:
+                outcomes = self._apply(conn, batch)
+            except Exception as exc:
+                # The commit itself failed (database busy past the
+                # timeout, disk full): every write in the batch fails
+                for future, _, _, _ in batch:
+                    future.set_exception(exc)
+                continue
+
+            self.batches += 1
+            self.writes += len(batch)
+            for (future, _, _, _), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        conn.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.close()
+
+
+def make_backend(kind=BACKEND):
+    if kind == "single":
+        return SingleBackend()
+    if kind == "sharded":
+        return ShardedBackend()
+    if kind == "queue":
+        return WriteQueueBackend()
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,127 @@
+# Benchmark the task list queries on a synthetic database.
+#
+#   python bench_queries.py              # 100k tasks in a temporary directory
+#   python bench_queries.py --rows 20000 --keep bench.db
+#
+# Times the original full-table queries (no indexes, fetchall) against the
+# keyset-paginated query layer in tasks.py, for the first page and for a page
+# deep into the list, times task search, and prints the query plans SQLite
+# chose.
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import storage
+import tasks
+
+LEGACY_QUERIES = {
+    "pending": "SELECT id, title, description, created_at, deadline FROM tasks WHERE status='pending' ORDER BY deadline ASC",
+    "completed": "SELECT id, title, description, deadline, completed_at, verification_result FROM tasks WHERE status='completed' ORDER BY completed_at DESC",
+    "choices": "SELECT id, title FROM tasks WHERE status='pending'",
+}
+
+
+def build_database(path, rows, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+
+    conn = sqlite3.connect(path)
+    # Only the first migration: the schema as it was before this layer
+    storage._migrate_create_tasks(conn)
+
+    def generate():
+        for i in range(rows):
+            created = start + timedelta(minutes=rng.randrange(525600))
+            deadline = created + timedelta(hours=rng.randrange(1, 24 * 30))
+            if rng.random() < 0.5:
+                completed = created + timedelta(hours=rng.randrange(1, 24 * 30))
+                yield (f"Task {i}", f"Synthetic task number {i}", created, deadline,
+                       completed, "completed", "VERIFIED. Looks done.")
+            else:
+                yield (f"Task {i}", f"Synthetic task number {i}", created, deadline,
+                       None, "pending", None)
+
+    conn.executemany(
+        "INSERT INTO tasks (title, description, created_at, deadline, completed_at, status, verification_result) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        generate(),
+    )
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def deep_cursor(page_fn, conn, pages):
+    cursor = None
+    for _ in range(pages):
+        _, cursor = page_fn(conn, after=cursor)
+    return cursor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark task list queries")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--deep-page", type=int, default=500,
+                        help="page number used for the deep-page measurement")
+    parser.add_argument("--keep", metavar="PATH", help="write the database here and keep it")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    path = args.keep or os.path.join(tmpdir.name, "bench.db")
+    if os.path.exists(path):
+        os.remove(path)
+
+    print(f"Building {args.rows} synthetic tasks in {path} ...")
+    build_database(path, args.rows)
+
+    conn = sqlite3.connect(path)
+    print("\nBefore (no indexes, fetchall):")
+    for name, sql in LEGACY_QUERIES.items():
+        ms = timed(lambda: conn.execute(sql).fetchall(), args.repeat)
+        print(f"  {name:<10} {ms:9.2f} ms")
+    conn.close()
+
+    pool = storage.ConnectionPool(path, size=1)
+    with pool.connection() as conn:
+        pending_deep = deep_cursor(tasks.pending_page, conn, args.deep_page)
+        completed_deep = deep_cursor(tasks.completed_page, conn, args.deep_page)
+
+        print(f"\nAfter (indexes, keyset pages of {tasks.PAGE_SIZE}):")
+        cases = {
+            "pending": lambda: tasks.pending_page(conn),
+            f"pending p{args.deep_page}": lambda: tasks.pending_page(conn, after=pending_deep),
+            "completed": lambda: tasks.completed_page(conn),
+            f"completed p{args.deep_page}": lambda: tasks.completed_page(conn, after=completed_deep),
+            "choices": lambda: tasks.pending_choices(conn),
+            "search common": lambda: tasks.search_pending(conn, "synthetic task"),
+            "search rare": lambda: tasks.search_pending(conn, "number 4242"),
+        }
+        for name, fn in cases.items():
+            print(f"  {name:<15} {timed(fn, args.repeat):9.2f} ms")
+
+        print("\nQuery plans:")
+        for status, column, op in (("pending", "deadline", ">"), ("completed", "completed_at", "<")):
+            direction = "ASC" if op == ">" else "DESC"
+            sql = (f"SELECT id FROM tasks WHERE status=? AND ({column}, id) {op} (?, ?) "
+                   f"ORDER BY {column} {direction}, id {direction} LIMIT 26")
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", (status, 1_750_000_000, 0)):
+                print(f"  {status:<10} {row[-1]}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Benchmark how long a fresh server process takes to import the app and
+# render its first page.
+#
+#   python bench_startup.py                  # best of 5, default thresholds
+#   python bench_startup.py --repeat 10 --max-import-ms 120
+#
+# Each measurement runs in a new interpreter, so nothing is already
+# imported or cached. The import is measured with -X importtime after
+# streamlit itself has loaded, and the slowest modules it pulled in are
+# listed; the first render is a full AppTest run of app.py against an empty
+# temporary database. The best of --repeat runs is compared against the
+# thresholds, and the exit status is 1 when one is exceeded or when a module
+# in HEAVY_MODULES, which is only needed once a photo is verified, was
+# loaded: a regression for CI to catch.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Loaded on first use only (groq_client, images, triage)
+HEAVY_MODULES = ("groq", "httpx", "pydantic", "PIL")
+
+IMPORT_SCRIPT = f"""
+import json, sys
+import streamlit
+import app
+print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))
+"""
+
+FIRST_RUN_SCRIPT = f"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+print(json.dumps({{
+    "ms": (time.perf_counter() - started) * 1000,
+    "exceptions": [e.message for e in at.exception],
+    "loaded": sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules),
+}}))
+"""
+
+
+def environment(directory):
+    # Everything the app writes goes to a scratch directory
+    env = dict(os.environ)
+    env.update({
+        "TODO_DB_PATH": os.path.join(directory, "todo.db"),
+        "TODO_EVIDENCE_DIR": os.path.join(directory, "evidence"),
+        "TODO_METRICS_DIR": os.path.join(directory, "metrics"),
+        "REMINDER_SINK": "file:" + os.path.join(directory, "reminders.jsonl"),
+    })
+    env.setdefault("GROQ_API_KEY", "benchmark")
+    return env
+
+
+def parse_importtime(stderr):
+    # (app cumulative ms, [(self ms, module)]) for the modules imported while
+    # importing app, from -X importtime output:
+    #   import time: self [us] | cumulative | imported package
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+    # Top level entries are not indented; app's imports are the entries
+    # between streamlit's and app's own
+    start = max(i for i, (_, _, name) in enumerate(entries) if name.strip() == "streamlit" and name[1] != " ")
+    end = next(i for i, (_, _, name) in enumerate(entries) if name.strip() == "app" and name[1] != " ")
+    modules = [(self_us / 1000, name.strip()) for self_us, _, name in entries[start + 1:end + 1]]
+    return entries[end][1] / 1000, sorted(modules, reverse=True)
+
+
+def measure_import(directory):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+        cwd=ROOT, env=environment(directory), capture_output=True, text=True, check=True,
+    )
+    ms, modules = parse_importtime(result.stderr)
+    return ms, modules, json.loads(result.stdout.splitlines()[-1])
+
+
+def measure_first_run(directory):
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_RUN_SCRIPT],
+        cwd=ROOT, env=environment(directory), capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app import and first render")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imported modules to list")
+    parser.add_argument("--max-import-ms", type=float, default=150.0)
+    parser.add_argument("--max-first-run-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    imports = []
+    first_runs = []
+    loaded = set()
+    exceptions = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            ms, modules, heavy = measure_import(directory)
+            imports.append((ms, modules))
+            loaded.update(heavy)
+        with tempfile.TemporaryDirectory() as directory:
+            run = measure_first_run(directory)
+            first_runs.append(run["ms"])
+            loaded.update(run["loaded"])
+            exceptions += run["exceptions"]
+
+    import_ms, modules = min(imports)
+    first_run_ms = min(first_runs)
+    print(f"import app    {import_ms:9.1f} ms  (best of {args.repeat}, limit {args.max_import_ms:.0f})")
+    print(f"first render  {first_run_ms:9.1f} ms  (best of {args.repeat}, limit {args.max_first_run_ms:.0f})")
+    print("\nSlowest modules imported by app (self time):")
+    for self_ms, name in modules[:args.top]:
+        print(f"  {name:<40} {self_ms:7.1f} ms")
+
+    failures = []
+    if import_ms > args.max_import_ms:
+        failures.append(f"importing app took {import_ms:.1f} ms")
+    if first_run_ms > args.max_first_run_ms:
+        failures.append(f"the first render took {first_run_ms:.1f} ms")
+    if loaded:
+        failures.append(f"loaded at startup: {', '.join(sorted(loaded))}")
+    if exceptions:
+        failures.append(f"the first render raised: {exceptions[0]}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
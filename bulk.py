@@ -0,0 +1,324 @@
+# Bulk import and export of tasks.
+#
+#   python bulk.py import backlog.csv [--allow-past]
+#   python bulk.py export tasks.jsonl [--status completed]
+#
+# Imports read CSV (with a header row) or JSON lines, one task per row:
+#
+#   title                 required
+#   description           optional
+#   deadline              ISO 8601 (local time unless it has an offset) or
+#                         epoch seconds; empty for no deadline
+#   status                "pending" (default) or "completed"
+#   created_at, completed_at, verification_result, verdict, confidence
+#                         optional; completed_at is required for completed
+#                         tasks
+#
+# Rows are validated as they are read and inserted with executemany in
+# chunks of CHUNK_SIZE, all inside one transaction: an import of any size
+# costs one commit, and a failure part way leaves the database untouched.
+# The search index is filled in once at the end rather than by the per-row
+# trigger (storage.deferred_insert_triggers). Invalid rows are skipped and
+# reported with their line numbers.
+#
+# Exports write the same columns, so an export can be imported again; tasks
+# still being verified are exported as pending, as that is what they return
+# to without their verification job. The
+# cursor is read EXPORT_BATCH rows at a time with fetchmany and each batch
+# is written out before the next is read, so memory stays flat however many
+# tasks there are.
+import argparse
+import csv
+import io
+import json
+import math
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+import storage
+import tasks
+
+# Rows per executemany call
+CHUNK_SIZE = 1000
+
+# Rows per fetchmany call when exporting
+EXPORT_BATCH = 1000
+
+# Row errors kept in an import report; the rest are only counted
+MAX_ERRORS = 100
+
+# Epoch seconds accepted for a date: the years datetime can show again on
+# export, with a day to spare for time zones
+MIN_EPOCH = -62135596800 + 86400
+MAX_EPOCH = 253402300799 - 86400
+
+FIELDS = [
+    "id", "title", "description", "status", "created_at", "deadline", "completed_at",
+    "verification_result", "verdict", "confidence",
+]
+
+STATUSES = ("pending", "completed")
+# verifier.VERIFIED and NOT_VERIFIED
+VERDICTS = ("verified", "not_verified")
+
+FORMATS = ("csv", "jsonl")
+
+ImportReport = namedtuple("ImportReport", ["imported", "skipped", "errors", "seconds"])
+
+
+class RowError(ValueError):
+    pass
+
+
+def rows_per_second(report):
+    return report.imported / report.seconds if report.seconds > 0 else float("inf")
+
+
+def format_for(path):
+    # "csv" or "jsonl", from a file name
+    suffix = Path(path).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path}; use .csv or .jsonl")
+
+
+def parse_time(value, field):
+    # Epoch seconds from an int, a numeric string or an ISO 8601 string;
+    # None for an empty value
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not math.isfinite(value)):
+        raise RowError(f"{field} is not a date: {value!r}")
+    if isinstance(value, (int, float)):
+        epoch = int(value)
+    elif str(value).strip().lstrip("-").isdigit():
+        epoch = int(str(value).strip())
+    else:
+        try:
+            epoch = int(datetime.fromisoformat(str(value).strip()).timestamp())
+        except (ValueError, OverflowError, OSError):
+            raise RowError(f"{field} is not an ISO 8601 date or epoch seconds: {value!r}")
+    if not MIN_EPOCH <= epoch <= MAX_EPOCH:
+        raise RowError(f"{field} is out of range: {value!r}")
+    return epoch
+
+
+def format_time(epoch):
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch).astimezone().isoformat()
+
+
+def validate(record, now, allow_past=False):
+    # One input record (a dict of strings or JSON values) as an INSERT
+    # parameter tuple, or RowError
+    title = str(record.get("title") or "").strip()
+    if not title:
+        raise RowError("title is missing")
+    description = str(record.get("description") or "")
+
+    status = str(record.get("status") or "pending").strip().lower()
+    if status not in STATUSES:
+        raise RowError(f"status must be one of {', '.join(STATUSES)}: {status!r}")
+
+    created_at = parse_time(record.get("created_at"), "created_at")
+    created_at = now if created_at is None else created_at
+    deadline = parse_time(record.get("deadline"), "deadline")
+    if deadline is not None and deadline < created_at:
+        raise RowError("deadline is before created_at")
+    if status == "pending" and deadline is not None and deadline <= now and not allow_past:
+        raise RowError("deadline is in the past")
+
+    completed_at = verification_result = verdict = confidence = None
+    if status == "completed":
+        completed_at = parse_time(record.get("completed_at"), "completed_at")
+        if completed_at is None:
+            raise RowError("completed_at is missing for a completed task")
+        verification_result = str(record.get("verification_result") or "") or None
+        verdict = str(record.get("verdict") or "").strip().lower() or None
+        if verdict is not None and verdict not in VERDICTS:
+            raise RowError(f"verdict must be one of {', '.join(VERDICTS)}: {verdict!r}")
+        confidence = record.get("confidence")
+        if confidence in (None, ""):
+            confidence = None
+        else:
+            try:
+                confidence = float(confidence)
+            except (TypeError, ValueError):
+                raise RowError(f"confidence is not a number: {confidence!r}")
+            if not 0.0 <= confidence <= 1.0:
+                raise RowError(f"confidence must be between 0 and 1: {confidence}")
+
+    return (title, description, created_at, deadline, status, completed_at, verification_result, verdict, confidence)
+
+
+def read_records(stream, fmt):
+    # (line number, record) pairs from a text stream
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, RowError(f"invalid JSON: {exc}")
+                continue
+            if not isinstance(record, dict):
+                record = RowError("expected a JSON object")
+            yield line_number, record
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def import_tasks(conn, stream, fmt, allow_past=False, now=None, commit=True):
+    # Insert every valid record of `stream` in one transaction; returns an
+    # ImportReport whose errors are (line number, message) pairs. With
+    # commit=False it runs inside the caller's transaction instead.
+    now = tasks.now_epoch() if now is None else now
+    errors = []
+    skipped = 0
+    imported = 0
+
+    def valid_rows():
+        nonlocal skipped
+        for line_number, record in read_records(stream, fmt):
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                row = validate(record, now, allow_past)
+            except RowError as exc:
+                skipped += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append((line_number, str(exc)))
+                continue
+            yield row
+
+    started = time.perf_counter()
+    rows = valid_rows()
+    if commit:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        with storage.deferred_insert_triggers(conn):
+            while True:
+                chunk = list(islice(rows, CHUNK_SIZE))
+                if not chunk:
+                    break
+                conn.executemany(
+                    "INSERT INTO tasks (title, description, created_at, deadline, status, completed_at, "
+                    "verification_result, verdict, confidence) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    chunk
+                )
+                imported += len(chunk)
+        if commit:
+            conn.execute("COMMIT")
+    except BaseException:
+        if commit:
+            conn.execute("ROLLBACK")
+        raise
+    return ImportReport(imported, skipped, errors, time.perf_counter() - started)
+
+
+def export_rows(conn, status=None):
+    # Task tuples in FIELDS order, read EXPORT_BATCH at a time
+    if status == "pending":
+        where, params = "WHERE status IN ('pending', 'verifying')", ()
+    elif status is not None:
+        where, params = "WHERE status=?", (status,)
+    else:
+        where, params = "", ()
+    cursor = conn.execute(f"SELECT {', '.join(FIELDS)} FROM tasks {where} ORDER BY id", params)
+    while True:
+        batch = cursor.fetchmany(EXPORT_BATCH)
+        if not batch:
+            break
+        yield from batch
+
+
+def _export_record(row):
+    record = dict(zip(FIELDS, row))
+    if record["status"] == "verifying":
+        record["status"] = "pending"
+    for field in ("created_at", "deadline", "completed_at"):
+        record[field] = format_time(record[field])
+    return record
+
+
+def export_tasks(conn, stream, fmt, status=None):
+    # Write tasks to a text stream; returns the number written
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in export_rows(conn, status):
+            writer.writerow(_export_record(row))
+            count += 1
+    elif fmt == "jsonl":
+        for row in export_rows(conn, status):
+            stream.write(json.dumps(_export_record(row)) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    return count
+
+
+def text_stream(binary, fmt, encoding="utf-8-sig"):
+    # Text view of a binary file; by default tolerates a UTF-8 BOM when
+    # reading, pass encoding="utf-8" to write without one
+    return io.TextIOWrapper(binary, encoding=encoding, newline="" if fmt == "csv" else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export of tasks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="add tasks from a CSV or JSONL file")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=FORMATS)
+    importer.add_argument("--allow-past", action="store_true", help="accept pending tasks already overdue")
+
+    exporter = commands.add_parser("export", help="write tasks to a CSV or JSONL file ('-' for stdout)")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=FORMATS)
+    exporter.add_argument("--status", choices=STATUSES)
+
+    parser.add_argument("--db", default=storage.DB_PATH)
+    args = parser.parse_args()
+
+    pool = storage.ConnectionPool(args.db, size=1)
+    status = 0
+    with pool.connection() as conn:
+        if args.command == "import":
+            fmt = args.format or format_for(args.path)
+            with open(args.path, "rb") as f:
+                report = import_tasks(conn, text_stream(f, fmt), fmt, allow_past=args.allow_past)
+            for line_number, message in report.errors:
+                print(f"{args.path}:{line_number}: {message}", file=sys.stderr)
+            print(f"Imported {report.imported} tasks, skipped {report.skipped}, "
+                  f"in {report.seconds:.2f}s ({rows_per_second(report):,.0f} rows/s)")
+            status = 1 if report.skipped else 0
+        else:
+            fmt = args.format or ("jsonl" if args.path == "-" else format_for(args.path))
+            started = time.perf_counter()
+            if args.path == "-":
+                count = export_tasks(conn, sys.stdout, fmt, args.status)
+            else:
+                with open(args.path, "w", newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+                    count = export_tasks(conn, f, fmt, args.status)
+            seconds = time.perf_counter() - started
+            print(f"Exported {count} tasks in {seconds:.2f}s", file=sys.stderr)
+    pool.close()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# Content-addressed store for evidence photos.
+#
+# Every upload is stored once under the sha256 of its bytes, alongside a
+# thumbnail and a display-size rendition made at ingest, so pages never
+# decode or resize the original again. Files are laid out as
+#
+#   evidence/ab/abcdef....original
+#   evidence/ab/abcdef....thumb.jpg
+#   evidence/ab/abcdef....display.jpg
+#
+# and rows in the evidence table link them to tasks. Renditions are served
+# from read-only memory maps, which stay open for recently viewed photos.
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import images
+import tasks
+
+# Root directory of the store
+EVIDENCE_DIR = os.environ.get("TODO_EVIDENCE_DIR", "evidence")
+
+# Longest side, in pixels, of each rendition
+THUMB_SIDE = 160
+DISPLAY_SIDE = 800
+RENDITION_QUALITY = 80
+
+# Memory maps kept open at once, least recently used closed first
+MAPPED_FILES = 128
+
+ORIGINAL = "original"
+THUMB = "thumb.jpg"
+DISPLAY = "display.jpg"
+
+
+def blob_id(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class EvidenceStore:
+
+    def __init__(self, root=EVIDENCE_DIR, mapped_files=MAPPED_FILES):
+        self.root = Path(root)
+        self.mapped_files = mapped_files
+        self._lock = threading.Lock()
+        self._maps = OrderedDict()
+
+    def path(self, sha256, kind=ORIGINAL):
+        return self.root / sha256[:2] / f"{sha256}.{kind}"
+
+    def _write(self, path, data):
+        # Write-then-rename, so readers never see a partial file and two
+        # processes ingesting the same photo cannot corrupt it
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=path.parent, prefix=".ingest-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(partial, path)
+        except BaseException:
+            os.unlink(partial)
+            raise
+
+    def ingest(self, image_bytes):
+        # Returns the photo's sha256. Identical uploads are stored, and
+        # their renditions made, only once.
+        sha256 = blob_id(image_bytes)
+        if self.path(sha256, DISPLAY).exists():
+            return sha256
+
+        _, encoded = images.renditions(
+            image_bytes, (THUMB_SIDE, DISPLAY_SIDE), quality=RENDITION_QUALITY, output_format="JPEG"
+        )
+        self._write(self.path(sha256, ORIGINAL), image_bytes)
+        self._write(self.path(sha256, THUMB), encoded[THUMB_SIDE])
+        # The display rendition is written last; its presence marks a
+        # complete ingest
+        self._write(self.path(sha256, DISPLAY), encoded[DISPLAY_SIDE])
+        return sha256
+
+    def read(self, sha256, kind=THUMB):
+        # Bytes of a stored file, read through a cached memory map
+        key = (sha256, kind)
+        with self._lock:
+            mapped = self._maps.get(key)
+            if mapped is not None:
+                self._maps.move_to_end(key)
+                return mapped[:]
+
+            with open(self.path(sha256, kind), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[key] = mapped
+            while len(self._maps) > self.mapped_files:
+                _, evicted = self._maps.popitem(last=False)
+                evicted.close()
+            return mapped[:]
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+
+def attach(conn, task_id, sha256, size, now=None):
+    # Link a stored photo (`size` bytes) to a task; the caller commits.
+    # Returns the new evidence id, or None when it was already linked.
+    now = tasks.now_epoch() if now is None else now
+    c = conn.execute(
+        "INSERT OR IGNORE INTO evidence (task_id, sha256, bytes, created_at) VALUES (?, ?, ?, ?)",
+        (task_id, sha256, size, now)
+    )
+    return c.lastrowid if c.rowcount else None
+
+
+def latest_for_tasks(conn, task_ids):
+    # {task_id: sha256} of the most recent photo for each task, in one query
+    if not task_ids:
+        return {}
+    placeholders = ", ".join("?" * len(task_ids))
+    return dict(conn.execute(
+        f"SELECT task_id, sha256 FROM evidence WHERE id IN ("
+        f"SELECT MAX(id) FROM evidence WHERE task_id IN ({placeholders}) GROUP BY task_id)",
+        tuple(task_ids)
+    ).fetchall())
@@ -0,0 +1,292 @@
+# Process-wide Groq client.
+#
+# Every verification in the process (Streamlit script threads, background
+# workers) goes through one client so HTTP keep-alive and TLS sessions are
+# reused. Calls are capped by a concurrency semaphore and paced by token
+# buckets sized to the account's requests-per-minute and tokens-per-minute
+# limits; a 429 pauses the buckets for the server's Retry-After.
+#
+# Set GROQ_BASE_URL to point the client at a local stub (see groq_stub.py).
+#
+# groq and httpx (with pydantic behind them) take longer to import than the
+# rest of the app, so they are imported where a client is built or called
+# rather than here, and only processes that verify something pay for them.
+import asyncio
+import os
+import threading
+import time
+
+# Seconds to wait for a connection and for a complete response
+CONNECT_TIMEOUT = float(os.environ.get("GROQ_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.environ.get("GROQ_TIMEOUT", "60"))
+
+# Pooled HTTP connections kept open to the API
+MAX_CONNECTIONS = int(os.environ.get("GROQ_MAX_CONNECTIONS", "10"))
+
+# Requests in flight at once, per process
+CONCURRENCY = int(os.environ.get("GROQ_CONCURRENCY", "4"))
+
+# Account budgets; the defaults match Groq's free tier for the vision model
+REQUESTS_PER_MINUTE = int(os.environ.get("GROQ_RPM", "30"))
+TOKENS_PER_MINUTE = int(os.environ.get("GROQ_TPM", "7000"))
+
+# 429s are retried this many times after waiting out Retry-After
+RATE_LIMIT_RETRIES = 3
+
+# Requests in flight at once for batch (async) verifications
+ASYNC_CONCURRENCY = int(os.environ.get("GROQ_ASYNC_CONCURRENCY", "8"))
+
+
+class TokenBucket:
+    # Refills continuously at `per_minute / 60` tokens per second up to
+    # `per_minute`. take() deducts only when the whole amount is available;
+    # otherwise it returns how long the refill needs, and the caller checks
+    # again after a short sleep, so tokens refunded in the meantime are
+    # used straight away instead of after a delay fixed up front.
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, amount):
+        # Seconds until `amount` is available, 0.0 if it is now
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds):
+        # Empty the bucket so nothing is granted for `seconds`
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# Longest a waiting caller sleeps before checking the buckets again
+POLL_INTERVAL = 0.1
+
+
+class RateLimiter:
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # Makes checking and taking from both buckets one step
+        self._lock = threading.Lock()
+
+    def try_acquire(self, estimated_tokens):
+        # Takes a request and the estimate if both are available and returns
+        # 0.0; otherwise takes nothing and returns the seconds to wait
+        # before trying again
+        with self._lock:
+            delay = max(self.requests.shortfall(1), self.tokens.shortfall(estimated_tokens))
+            if delay:
+                return min(delay, POLL_INTERVAL)
+            self.requests.take(1)
+            self.tokens.take(estimated_tokens)
+            return 0.0
+
+    def acquire(self, estimated_tokens):
+        while delay := self.try_acquire(estimated_tokens):
+            time.sleep(delay)
+
+    async def acquire_async(self, estimated_tokens):
+        while delay := self.try_acquire(estimated_tokens):
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens, used_tokens):
+        # Correct the reservation with the usage the API reported: unused
+        # estimate goes back, an underestimate is charged
+        if used_tokens is not None:
+            self.tokens.refund(estimated_tokens - used_tokens)
+
+    def pause(self, seconds):
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+
+def retry_after(exc, attempt):
+    # Seconds to wait after a 429, preferring the server's own hint
+    value = exc.response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return float(2 ** attempt)
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_CONNECTIONS,
+    )
+
+
+class SharedGroqClient:
+
+    def __init__(self, api_key=None, concurrency=CONCURRENCY, limiter=None):
+        import groq
+        import httpx
+
+        self.limiter = limiter or get_limiter()
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+        # Retries are handled here and by the job queue, where they respect
+        # the rate limiter; the SDK's own retries would not
+        self.client = groq.Groq(
+            api_key=api_key or os.environ.get("GROQ_API_KEY"),
+            http_client=self.http_client,
+            max_retries=0,
+        )
+
+    def chat_completion(self, estimated_tokens, **kwargs):
+        import groq
+
+        with self.semaphore:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                self.limiter.acquire(estimated_tokens)
+                try:
+                    completion = self.client.chat.completions.create(**kwargs)
+                except groq.RateLimitError as exc:
+                    if attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    delay = retry_after(exc, attempt)
+                    self.limiter.pause(delay)
+                    continue
+
+                usage = getattr(completion, "usage", None)
+                self.limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+                return completion
+
+    def stream_chat_completion(self, estimated_tokens, **kwargs):
+        # Yields completion chunks as they arrive. The concurrency slot is
+        # held until the stream is exhausted or closed.
+        import groq
+
+        with self.semaphore:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                self.limiter.acquire(estimated_tokens)
+                try:
+                    stream = self.client.chat.completions.create(stream=True, **kwargs)
+                except groq.RateLimitError as exc:
+                    if attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    self.limiter.pause(retry_after(exc, attempt))
+                    continue
+                break
+
+            with stream:
+                for chunk in stream:
+                    yield chunk
+
+    def close(self):
+        self.http_client.close()
+
+
+class AsyncSharedGroqClient:
+    # asyncio counterpart used for batch verification. It lives on the
+    # background event loop from get_event_loop() and shares the rate
+    # limiter with the synchronous client, so both draw on one budget.
+
+    def __init__(self, api_key=None, concurrency=ASYNC_CONCURRENCY, limiter=None):
+        import groq
+        import httpx
+
+        self.limiter = limiter or get_limiter()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        self.client = groq.AsyncGroq(
+            api_key=api_key or os.environ.get("GROQ_API_KEY"),
+            http_client=self.http_client,
+            max_retries=0,
+        )
+
+    async def chat_completion(self, estimated_tokens, **kwargs):
+        import groq
+
+        async with self.semaphore:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                await self.limiter.acquire_async(estimated_tokens)
+                try:
+                    completion = await self.client.chat.completions.create(**kwargs)
+                except groq.RateLimitError as exc:
+                    if attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    self.limiter.pause(retry_after(exc, attempt))
+                    continue
+
+                usage = getattr(completion, "usage", None)
+                self.limiter.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+                return completion
+
+
+_lock = threading.RLock()
+_limiter = None
+_client = None
+_async_client = None
+_loop = None
+
+
+def get_limiter():
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = SharedGroqClient()
+        return _client
+
+
+def get_event_loop():
+    # A long-lived loop on a daemon thread. Async HTTP connections are bound
+    # to the loop that opened them, so keeping one loop lets the async
+    # client's connection pool survive between batches.
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="groq-async", daemon=True).start()
+        return _loop
+
+
+def run_async(coro):
+    # Run `coro` on the background loop and block until it finishes
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def get_async_client():
+    # Must be called from the background loop
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncSharedGroqClient()
+        return _async_client
@@ -0,0 +1,166 @@
+# Local stand-in for Groq's chat.completions endpoint.
+#
+#   python groq_stub.py --port 8099 --latency 0.5 --rate-limit-every 5
+#   GROQ_BASE_URL=http://127.0.0.1:8099 GROQ_API_KEY=stub streamlit run app.py
+#
+# Answers every request with a fixed verdict after a configurable delay,
+# optionally returns 429 with Retry-After on every Nth request, and prints
+# how many requests were in flight at once so concurrency caps can be
+# checked without spending API quota.
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+
+class StubState:
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=1, reply=None):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.reply = reply or json.dumps(
+            {"verdict": "VERIFIED", "confidence": 0.9, "reason": "Stub verification."}
+        )
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def completion_body(model, content):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so connection reuse by the client is exercised
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, state, model):
+        # Server-sent events, one word per chunk, with the configured
+        # latency spread across them
+        words = state.reply.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        for index, word in enumerate(words):
+            time.sleep(state.latency / len(words))
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if index == 0 else " " + word},
+                    "finish_reason": "stop" if index == len(words) - 1 else None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        # StubState attached by make_server()
+        state = self.server.state
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        with state.lock:
+            state.requests += 1
+            number = state.requests
+            limited = state.rate_limit_every and number % state.rate_limit_every == 0
+            if limited:
+                state.rate_limited += 1
+            else:
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+
+        if limited:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                headers=[("retry-after", str(state.retry_after))],
+            )
+            return
+
+        try:
+            if request.get("stream"):
+                self._stream(state, request.get("model"))
+            else:
+                time.sleep(state.latency)
+                self._send_json(200, completion_body(request.get("model"), state.reply))
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+
+def make_server(host="127.0.0.1", port=0, **options):
+    # port=0 picks a free port; read it back from server.server_address
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Groq chat.completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port,
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+    )
+    print(f"Groq stub listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        state = server.state
+        print(f"\n{state.requests} requests, {state.rate_limited} rate limited, "
+              f"max {state.max_in_flight} in flight")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from metrics import span
+
+# Pillow is imported by the functions below rather than here: it is slow to
+# import, and most reruns never handle an image
+
+# Evidence photos are downscaled so their longest side is at most this many
+# pixels before upload; the vision model gains little from more
+MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1024"))
+
+# Re-encoding format (JPEG or WEBP) and quality
+OUTPUT_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+QUALITY = int(os.environ.get("IMAGE_QUALITY", "80"))
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+PreparedImage = namedtuple("PreparedImage", ["data", "mime_type", "bytes_before", "bytes_after"])
+
+# Decoding and re-encoding release the GIL, so a small pool keeps this work
+# off the Streamlit script thread
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-prep")
+
+_stats_lock = threading.Lock()
+_stats = {"images": 0, "bytes_before": 0, "bytes_after": 0}
+
+
+def _flatten(image):
+    # Neither output format needs transparency; composite onto white so
+    # transparent PNG regions do not turn black
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def preprocess_image(image_bytes, max_side=MAX_SIDE, quality=QUALITY, output_format=OUTPUT_FORMAT):
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {output_format}")
+    from PIL import Image, ImageOps
+
+    with span("image.preprocess"), Image.open(BytesIO(image_bytes)) as image:
+        # Phone cameras store rotation in EXIF; apply it to the pixels since
+        # the metadata is dropped below
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        image = _flatten(image)
+
+        # Saving without exif/icc arguments writes no metadata
+        output = BytesIO()
+        image.save(output, output_format, quality=quality, optimize=True)
+
+    data = output.getvalue()
+    with _stats_lock:
+        _stats["images"] += 1
+        _stats["bytes_before"] += len(image_bytes)
+        _stats["bytes_after"] += len(data)
+
+    return PreparedImage(data, MIME_TYPES[output_format], len(image_bytes), len(data))
+
+
+def renditions(image_bytes, sides, quality=QUALITY, output_format=OUTPUT_FORMAT):
+    # Several downscaled copies from a single decode, each made from the next
+    # larger one. Returns the upright (width, height) of the original and
+    # {side: encoded bytes}.
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {output_format}")
+    from PIL import Image, ImageOps
+
+    encoded = {}
+    with span("image.renditions"), Image.open(BytesIO(image_bytes)) as image:
+        image = _flatten(ImageOps.exif_transpose(image))
+        size = image.size
+        for side in sorted(sides, reverse=True):
+            image.thumbnail((side, side), Image.LANCZOS)
+            output = BytesIO()
+            image.save(output, output_format, quality=quality, optimize=True)
+            encoded[side] = output.getvalue()
+
+    return size, encoded
+
+
+def preprocess_async(image_bytes, **options):
+    return _executor.submit(preprocess_image, image_bytes, **options)
+
+
+def preprocess_stats():
+    with _stats_lock:
+        return dict(_stats)
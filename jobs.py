@@ -0,0 +1,225 @@
+# Background verification queue.
+#
+# The Complete Task page enqueues a job and returns immediately; a bounded
+# pool of worker threads (inside the Streamlit process, or standalone via
+# `python jobs.py`) runs the model call and records the outcome. Jobs live
+# in the verification_jobs table, so queued work survives restarts and any
+# process sharing todo.db can pick it up.
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+import storage
+import tasks
+from verifier import parse_verification, verify_task_completion
+from verify_cache import VerificationCache
+
+# Number of worker threads per process
+WORKERS = int(os.environ.get("VERIFY_WORKERS", "2"))
+
+# Give up after this many attempts
+MAX_ATTEMPTS = int(os.environ.get("VERIFY_MAX_ATTEMPTS", "5"))
+
+# Retry delays grow as BACKOFF_BASE * 2 ** (attempt - 1), capped at BACKOFF_MAX
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+
+# A running job whose worker has not finished within this many seconds is
+# assumed lost (process crash, restart) and becomes claimable again
+LEASE_SECONDS = 600
+
+# Idle workers look for new jobs this often
+POLL_SECONDS = 1.0
+
+
+
+def transient_errors():
+    # Failures worth retrying: the request may well succeed a little later.
+    # Only called once a verification has failed, by which time groq has
+    # been imported by the client; idle workers never load it.
+    import groq
+
+    return (
+        groq.APIConnectionError,
+        groq.RateLimitError,
+        groq.InternalServerError,
+        sqlite3.OperationalError,
+    )
+
+
+def enqueue(conn, task_id, task_description, image_bytes, now=None, commit=True):
+    # Queue the job and take the task off the pending list in one
+    # transaction. The submission time is kept as the completion time so
+    # deadlines are judged by when the user submitted, not when the model
+    # answered.
+    now = tasks.now_epoch() if now is None else now
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO verification_jobs (task_id, task_description, image, submitted_at, status, next_attempt_at, updated_at) "
+        "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+        (task_id, task_description, image_bytes, now, now, now)
+    )
+    c.execute("UPDATE tasks SET status='verifying' WHERE id=?", (task_id,))
+    if commit:
+        conn.commit()
+    return c.lastrowid
+
+
+def get_job(conn, job_id):
+    # status, attempts, result, error, submitted_at, task deadline (epoch)
+    return conn.execute(
+        "SELECT j.status, j.attempts, j.result, j.error, j.submitted_at, t.deadline "
+        "FROM verification_jobs j JOIN tasks t ON t.id = j.task_id WHERE j.id=?",
+        (job_id,)
+    ).fetchone()
+
+
+def _claim(conn, now):
+    # BEGIN IMMEDIATE serialises claimers across threads and processes
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, task_id, task_description, image, submitted_at, attempts FROM verification_jobs "
+            "WHERE status IN ('queued', 'running') AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at, id LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE verification_jobs SET status='running', attempts=attempts+1, "
+                "next_attempt_at=?, updated_at=? WHERE id=?",
+                (now + LEASE_SECONDS, now, row[0])
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return row
+
+
+def backoff_delay(attempt):
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    # Jitter keeps retries from many jobs from arriving together
+    return delay * random.uniform(0.5, 1.0)
+
+
+class VerificationWorker:
+
+    def __init__(self, pool, cache=None, workers=WORKERS, max_attempts=MAX_ATTEMPTS):
+        self.pool = pool
+        self.cache = cache
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"verification-worker-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self):
+        # Called after enqueue so an idle worker starts without waiting for
+        # the next poll
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                worked = self.run_once()
+            except sqlite3.OperationalError:
+                # Database busy beyond busy_timeout; try again next poll
+                worked = False
+            except Exception as exc:
+                # Anything else is reported and the thread keeps going; a job
+                # it had claimed is picked up again once its lease expires
+                print(f"Verification worker error: {exc!r}", file=sys.stderr)
+                worked = False
+            if not worked:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+
+    def run_once(self):
+        # Process at most one job; returns False when none was ready
+        with self.pool.connection() as conn:
+            job = _claim(conn, tasks.now_epoch())
+        if job is None:
+            return False
+
+        job_id, task_id, task_description, image_bytes, submitted_at, attempts = job
+        attempt = attempts + 1
+        try:
+            result = verify_task_completion(image_bytes, task_description, cache=self.cache)
+        except transient_errors() as exc:
+            if attempt < self.max_attempts:
+                self._retry(job_id, attempt, exc)
+            else:
+                self._fail(job_id, task_id, exc)
+            return True
+        except Exception as exc:
+            self._fail(job_id, task_id, exc)
+            return True
+
+        self._finish(job_id, task_id, submitted_at, result)
+        return True
+
+    def _retry(self, job_id, attempt, exc):
+        now = tasks.now_epoch()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE verification_jobs SET status='queued', next_attempt_at=?, error=?, updated_at=? WHERE id=?",
+                (now + int(backoff_delay(attempt)), repr(exc), now, job_id)
+            )
+            conn.commit()
+
+    def _fail(self, job_id, task_id, exc):
+        # Put the task back on the pending list so the user can resubmit
+        now = tasks.now_epoch()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE verification_jobs SET status='failed', image=NULL, error=?, updated_at=? WHERE id=?",
+                (repr(exc), now, job_id)
+            )
+            conn.execute("UPDATE tasks SET status='pending' WHERE id=? AND status='verifying'", (task_id,))
+            conn.commit()
+
+    def _finish(self, job_id, task_id, submitted_at, result):
+        # The job row and the task are updated in the same transaction;
+        # complete_task commits both
+        now = tasks.now_epoch()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE verification_jobs SET status='done', image=NULL, result=?, error=NULL, updated_at=? WHERE id=?",
+                (result, now, job_id)
+            )
+            verification = parse_verification(result)
+            tasks.complete_task(
+                conn, task_id, verification.reason, completed_at=submitted_at,
+                verdict=verification.verdict, confidence=verification.confidence
+            )
+
+
+if __name__ == "__main__":
+    # Standalone worker process: python jobs.py
+    pool = storage.ConnectionPool()
+    worker = VerificationWorker(pool, cache=VerificationCache(pool)).start()
+    print(f"Verification worker running with {worker.workers} threads on {pool.path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker.stop()
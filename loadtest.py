@@ -0,0 +1,152 @@
+# Load test for the storage backends.
+#
+#   python loadtest.py                              # every backend
+#   python loadtest.py --backend queue --sessions 400 --processes 8
+#
+# Simulates concurrent sessions spread over several server processes, as
+# behind a load balancer. Each session repeatedly adds a task, lists its
+# pending page and completes the task, through the same backend calls the
+# app makes; the report gives p50 and p99 latency per operation, errors
+# (such as "database is locked") and overall throughput. Sessions share
+# --tenants tenants, which only the sharded backend keeps apart.
+import argparse
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import backends
+import tasks
+
+OPERATIONS = ("add", "list", "complete")
+
+
+def make(kind, directory):
+    if kind == "single":
+        return backends.SingleBackend(os.path.join(directory, "todo.db"))
+    if kind == "sharded":
+        return backends.ShardedBackend(os.path.join(directory, "shards"))
+    if kind == "queue":
+        return backends.WriteQueueBackend(os.path.join(directory, "todo.db"))
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def session(backend, tenant, rounds, think, start, results, errors):
+    start.wait()
+    for number in range(rounds):
+        for operation in OPERATIONS:
+            started = time.perf_counter()
+            try:
+                if operation == "add":
+                    task_id = backend.write(
+                        tenant, tasks.add_task, f"Load test task {number}", "Generated by loadtest.py",
+                        tasks.now_epoch() + 3600, commit=False
+                    )
+                elif operation == "list":
+                    with backend.pool(tenant).connection() as conn:
+                        tasks.pending_page(conn)
+                else:
+                    backend.write(
+                        tenant, tasks.complete_task, task_id, "Load test.", verdict="verified", commit=False
+                    )
+            except Exception as exc:
+                errors.append((operation, repr(exc)))
+                # Nothing to complete if the add failed
+                if operation == "add":
+                    break
+                continue
+            results[operation].append(time.perf_counter() - started)
+            if think:
+                time.sleep(think)
+
+
+def run_process(kind, directory, sessions, first_session, tenants, rounds, think):
+    # One server process: its own backend, one thread per session
+    backend = make(kind, directory)
+    results = {operation: [] for operation in OPERATIONS}
+    errors = []
+    start = threading.Barrier(sessions)
+    threads = [
+        threading.Thread(
+            target=session,
+            args=(backend, f"tenant{(first_session + number) % tenants}", rounds, think, start, results, errors),
+        )
+        for number in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    backend.close()
+    return results, errors
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run(kind, args):
+    with tempfile.TemporaryDirectory() as directory:
+        # Create the databases up front, as a deployment would have them
+        backend = make(kind, directory)
+        for tenant in range(args.tenants):
+            backend.pool(f"tenant{tenant}")
+        backend.close()
+
+        per_process = [args.sessions // args.processes + (index < args.sessions % args.processes)
+                       for index in range(args.processes)]
+        firsts = [sum(per_process[:index]) for index in range(args.processes)]
+        jobs = [(kind, directory, sessions, first, args.tenants, args.rounds, args.think)
+                for sessions, first in zip(per_process, firsts) if sessions]
+
+        started = time.perf_counter()
+        with multiprocessing.Pool(len(jobs)) as pool:
+            outcomes = pool.starmap(run_process, jobs)
+        elapsed = time.perf_counter() - started
+
+    results = {operation: [] for operation in OPERATIONS}
+    errors = []
+    for process_results, process_errors in outcomes:
+        for operation in OPERATIONS:
+            results[operation] += process_results[operation]
+        errors += process_errors
+    return results, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the storage backends")
+    parser.add_argument("--backend", choices=["single", "sharded", "queue", "all"], default="all")
+    parser.add_argument("--sessions", type=int, default=200, help="concurrent sessions in total")
+    parser.add_argument("--processes", type=int, default=4, help="server processes the sessions are spread over")
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10, help="add/list/complete rounds per session")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each session waits between operations")
+    args = parser.parse_args()
+
+    kinds = ["single", "sharded", "queue"] if args.backend == "all" else [args.backend]
+    print(f"{args.sessions} sessions over {args.processes} processes and {args.tenants} tenants, "
+          f"{args.rounds} rounds each\n")
+    print(f"{'backend':<8} {'op':<9} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind in kinds:
+        results, errors, elapsed = run(kind, args)
+        for operation in OPERATIONS:
+            latencies = results[operation]
+            failed = sum(1 for failed_operation, _ in errors if failed_operation == operation)
+            if latencies:
+                p50 = f"{percentile(latencies, 50) * 1000:8.1f}"
+                p99 = f"{percentile(latencies, 99) * 1000:8.1f}"
+            else:
+                p50 = p99 = f"{'-':>8}"
+            print(f"{kind:<8} {operation:<9} {len(latencies):>6} {failed:>6} {p50} {p99}")
+        done = sum(len(latencies) for latencies in results.values())
+        print(f"{kind:<8} {done / elapsed:,.0f} operations/s over {elapsed:.1f}s")
+        if errors:
+            print(f"{kind:<8} first error: {errors[0][1]}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Performance instrumentation.
+#
+#   TODO_METRICS=1 streamlit run app.py
+#
+# Records how long each stage of a script run takes (spans), how many SQL
+# statements ran and how many rows they returned, tagged with a request id
+# per rerun and a session id per browser session. Totals are exported as
+# Prometheus text to METRICS_DIR/metrics.prom and every finished rerun is
+# appended to METRICS_DIR/requests.jsonl.
+#
+# Disabled by default: span() then hands back a shared no-op context and
+# connections are left uninstrumented, so the cost is one attribute check.
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+ENABLED = os.environ.get("TODO_METRICS", "").lower() in ("1", "true", "yes")
+
+# Exporter output directory; the Prometheus file is rewritten at most every
+# EXPORT_INTERVAL seconds
+METRICS_DIR = Path(os.environ.get("TODO_METRICS_DIR", "metrics"))
+EXPORT_INTERVAL = 5.0
+
+# Span histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Finished reruns kept in memory for the debug panel
+RECENT_REQUESTS = 50
+
+_NOOP = nullcontext()
+
+
+class Request:
+    # One script run: its ids, the spans it recorded and its DB counters
+
+    def __init__(self, session_id):
+        self.id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.started = time.time()
+        self.duration = None
+        self.spans = []
+        self.db_queries = 0
+        self.db_rows = 0
+
+    def as_dict(self):
+        return {
+            "request_id": self.id,
+            "session_id": self.session_id,
+            "started": self.started,
+            "duration": self.duration,
+            "db_queries": self.db_queries,
+            "db_rows": self.db_rows,
+            "spans": [{"name": name, "seconds": seconds} for name, seconds in self.spans],
+        }
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # span name -> [count, sum, per-bucket counts]
+        self.spans = {}
+        self.counters = {"db_queries": 0, "db_rows": 0, "requests": 0}
+        self.recent = deque(maxlen=RECENT_REQUESTS)
+        self._exported = 0.0
+
+    def observe(self, name, seconds):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                entry = self.spans[name] = [0, 0.0, [0] * len(BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[2][index] += 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def finish(self, request):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.recent.append(request)
+
+    def prometheus(self):
+        with self._lock:
+            lines = [
+                "# HELP todo_span_seconds Time spent in each instrumented stage",
+                "# TYPE todo_span_seconds histogram",
+            ]
+            for name, (count, total, buckets) in sorted(self.spans.items()):
+                for bound, value in zip(BUCKETS, buckets):
+                    lines.append(f'todo_span_seconds_bucket{{span="{name}",le="{bound}"}} {value}')
+                lines.append(f'todo_span_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+                lines.append(f'todo_span_seconds_sum{{span="{name}"}} {total:.6f}')
+                lines.append(f'todo_span_seconds_count{{span="{name}"}} {count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE todo_{name}_total counter")
+                lines.append(f"todo_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._exported < EXPORT_INTERVAL:
+                return
+            self._exported = now
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so a scraper never reads a half-written file
+        target = METRICS_DIR / "metrics.prom"
+        partial = target.with_suffix(".prom.tmp")
+        partial.write_text(self.prometheus())
+        partial.replace(target)
+
+
+registry = Registry()
+if ENABLED:
+    atexit.register(registry.export, force=True)
+_current = contextvars.ContextVar("request", default=None)
+_jsonl_lock = threading.Lock()
+
+
+def current_request():
+    return _current.get()
+
+
+def begin_request(session_id):
+    # Start a rerun; spans and DB counters in this thread are attributed to it
+    if not ENABLED:
+        return None
+    request = Request(session_id)
+    _current.set(request)
+    return request
+
+
+def end_request():
+    request = _current.get()
+    if request is None:
+        return None
+    _current.set(None)
+    request.duration = time.time() - request.started
+    registry.observe("rerun", request.duration)
+    registry.finish(request)
+
+    line = json.dumps(request.as_dict())
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    with _jsonl_lock, open(METRICS_DIR / "requests.jsonl", "a") as f:
+        f.write(line + "\n")
+    registry.export()
+    return request
+
+
+@contextmanager
+def _span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        registry.observe(name, seconds)
+        request = _current.get()
+        if request is not None:
+            request.spans.append((name, seconds))
+
+
+def span(name):
+    # with metrics.span("query.pending"): ...
+    return _span(name) if ENABLED else _NOOP
+
+
+def _trace(statement):
+    registry.count("db_queries")
+    request = _current.get()
+    if request is not None:
+        request.db_queries += 1
+
+
+def _count_row(cursor, row):
+    registry.count("db_rows")
+    request = _current.get()
+    if request is not None:
+        request.db_rows += 1
+    return row
+
+
+def instrument_connection(conn):
+    # Count statements through the trace hook and fetched rows through the
+    # row factory, which returns rows unchanged
+    if ENABLED:
+        conn.set_trace_callback(_trace)
+        conn.row_factory = _count_row
+    return conn
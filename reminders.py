@@ -0,0 +1,325 @@
+# Deadline reminders, sent from the server.
+#
+# A scheduler thread keeps a min-heap of upcoming reminder instants (24
+# hours before, 1 hour before and at the deadline) for pending tasks. It
+# does not hold every task: tasks are read from idx_tasks_status_deadline
+# in deadline order only as far as HORIZON ahead, and the window slides
+# forward as time passes. New tasks are pushed as they are added (the app
+# calls schedule()) or noticed by id, so tasks added by another process
+# are picked up too; tasks handed in are dropped with cancel(). A task whose
+# verification fails goes back to pending (jobs.VerificationWorker._fail),
+# so tasks handed in are watched until they are completed, and rescheduled
+# if they return. Before a reminder goes out the task is checked again, so
+# a stale heap entry never reaches the user.
+#
+# Reminders are handed to a sink: a JSON-lines file, a webhook (standing in
+# for a Web Push service) or stdout, chosen with REMINDER_SINK. Each
+# (task, reminder) is recorded in reminders_sent first, so several
+# processes can run schedulers against one database without sending twice.
+#
+#   REMINDER_SINK=file:reminders.jsonl python reminders.py
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import storage
+import tasks
+
+# (kind, seconds before the deadline)
+REMINDERS = (("24h", 24 * 3600), ("1h", 3600), ("due", 0))
+
+# Tasks are loaded this far ahead of their earliest reminder; the window
+# moves forward every HORIZON / 2
+HORIZON = 6 * 3600
+
+# Reminders found less than this late (scheduler restarts, tasks added just
+# before a reminder instant) are still sent; older ones are skipped
+GRACE_SECONDS = 300
+
+# New tasks from other processes are looked for this often
+POLL_SECONDS = 30
+
+# Failed deliveries are retried after this long
+RETRY_SECONDS = 60
+
+# Rows read per query when loading
+LOAD_BATCH = 500
+
+# "file:PATH", "webhook:URL" or "stdout"
+SINK = os.environ.get("REMINDER_SINK", "file:reminders.jsonl")
+
+LEAD = max(seconds for _, seconds in REMINDERS)
+
+
+class FileSink:
+    # Appends one JSON object per reminder
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(reminder) + "\n")
+
+
+class WebhookSink:
+    # POSTs each reminder as JSON; a push service or relay goes behind it
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminder):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(reminder).encode(),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class StdoutSink:
+
+    def send(self, reminder):
+        print(json.dumps(reminder), flush=True)
+
+
+def make_sink(spec=SINK):
+    kind, _, target = spec.partition(":")
+    if kind == "file":
+        return FileSink(target or "reminders.jsonl")
+    if kind == "webhook":
+        return WebhookSink(target)
+    if kind == "stdout":
+        return StdoutSink()
+    raise ValueError(f"Unknown reminder sink: {spec}")
+
+
+def reminder_times(deadline):
+    return [(deadline - seconds, kind) for kind, seconds in REMINDERS]
+
+
+class ReminderScheduler:
+
+    def __init__(self, pool, sink=None, horizon=HORIZON):
+        self.pool = pool
+        self.sink = sink or make_sink()
+        self.horizon = horizon
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # (fire_at, task_id, kind, deadline); entries whose deadline no
+        # longer matches _deadlines are stale and skipped
+        self._heap = []
+        self._deadlines = {}
+        # Tasks with deadlines up to (loaded_deadline, loaded_id) are in the
+        # heap; max_id is the newest task seen
+        self._loaded = None
+        self._max_id = 0
+        # Tasks being verified, which may yet come back to pending
+        self._verifying = set()
+        self._polled = 0.0
+        self.sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        self._wake.set()
+
+    def _push(self, task_id, deadline, now):
+        self._deadlines[task_id] = deadline
+        for fire_at, kind in reminder_times(deadline):
+            if fire_at >= now - GRACE_SECONDS:
+                heapq.heappush(self._heap, (fire_at, task_id, kind, deadline))
+
+    def _within_loaded(self, task_id, deadline):
+        return self._loaded is not None and (deadline, task_id) <= self._loaded
+
+    def schedule(self, task_id, deadline, now=None):
+        # Called when a task is added. Tasks beyond the loaded window are
+        # read when the window reaches them.
+        if deadline is None:
+            return
+        now = tasks.now_epoch() if now is None else now
+        with self._lock:
+            if self._within_loaded(task_id, deadline):
+                self._push(task_id, deadline, now)
+        self._wake.set()
+
+    def cancel(self, task_id):
+        # Called when a task is completed or submitted for verification; its
+        # heap entries become stale until it is seen pending again
+        with self._lock:
+            self._deadlines.pop(task_id, None)
+            self._verifying.add(task_id)
+
+    def _load(self, conn, now):
+        # Slide the window forward: pending tasks in deadline order, from
+        # where the last load stopped up to the new horizon
+        until = now + self.horizon + LEAD
+        if self._loaded is None:
+            self._max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+            self._verifying.update(
+                task_id for task_id, in conn.execute("SELECT id FROM tasks WHERE status='verifying'")
+            )
+            cursor = (now - GRACE_SECONDS, 0)
+        else:
+            cursor = self._loaded
+        while True:
+            rows = conn.execute(
+                "SELECT id, deadline FROM tasks WHERE status='pending' AND deadline IS NOT NULL "
+                "AND (deadline, id) > (?, ?) AND deadline <= ? ORDER BY deadline, id LIMIT ?",
+                (cursor[0], cursor[1], until, LOAD_BATCH)
+            ).fetchall()
+            for task_id, deadline in rows:
+                self._push(task_id, deadline, now)
+            if len(rows) < LOAD_BATCH:
+                break
+            cursor = (rows[-1][1], rows[-1][0])
+        self._loaded = (until, sys.maxsize)
+
+    def _poll_new(self, conn, now):
+        # Tasks added since the last look (by any process) whose deadlines
+        # fall inside the loaded window
+        rows = conn.execute(
+            "SELECT id, deadline FROM tasks WHERE id > ? AND status='pending' ORDER BY id",
+            (self._max_id,)
+        ).fetchall()
+        for task_id, deadline in rows:
+            self._max_id = task_id
+            if deadline is not None and task_id not in self._deadlines and self._within_loaded(task_id, deadline):
+                self._push(task_id, deadline, now)
+
+    def _poll_returned(self, conn, now):
+        # Tasks being verified that are pending again get their remaining
+        # reminders back; completed ones are no longer watched
+        ids = list(self._verifying)
+        for start in range(0, len(ids), LOAD_BATCH):
+            chunk = ids[start:start + LOAD_BATCH]
+            rows = dict((task_id, (status, deadline)) for task_id, status, deadline in conn.execute(
+                f"SELECT id, status, deadline FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+            for task_id in chunk:
+                status, deadline = rows.get(task_id, (None, None))
+                if status == "verifying":
+                    continue
+                self._verifying.discard(task_id)
+                if status == "pending" and deadline is not None and self._within_loaded(task_id, deadline):
+                    self._push(task_id, deadline, now)
+
+    def _due(self, now):
+        # Pop the live reminders whose time has come
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, task_id, kind, deadline = heapq.heappop(self._heap)
+            if self._deadlines.get(task_id) != deadline:
+                continue
+            due.append((fire_at, task_id, kind, deadline))
+            if kind == "due":
+                del self._deadlines[task_id]
+        return due
+
+    def _deliver(self, conn, fire_at, task_id, kind, deadline, now):
+        # Re-check the task, claim the reminder, then send it
+        row = conn.execute(
+            "SELECT title, status FROM tasks WHERE id=? AND deadline=?", (task_id, deadline)
+        ).fetchone()
+        if row is None or row[1] != "pending":
+            if row is not None and row[1] == "verifying":
+                # Handed in by another process; sent if it comes back
+                with self._lock:
+                    self._verifying.add(task_id)
+            return False
+        claimed = conn.execute(
+            "INSERT OR IGNORE INTO reminders_sent (task_id, kind, deadline, sent_at) VALUES (?, ?, ?, ?)",
+            (task_id, kind, deadline, now)
+        ).rowcount
+        conn.commit()
+        if not claimed:
+            return False
+
+        reminder = {
+            "task_id": task_id,
+            "title": row[0],
+            "kind": kind,
+            "deadline": deadline,
+            "fire_at": fire_at,
+            "sent_at": now,
+        }
+        try:
+            self.sink.send(reminder)
+        except Exception:
+            # Release the claim and try again later
+            conn.execute(
+                "DELETE FROM reminders_sent WHERE task_id=? AND kind=? AND deadline=?",
+                (task_id, kind, deadline)
+            )
+            conn.commit()
+            with self._lock:
+                self._deadlines.setdefault(task_id, deadline)
+                heapq.heappush(self._heap, (now + RETRY_SECONDS, task_id, kind, deadline))
+            return False
+        return True
+
+    def run_once(self, now=None):
+        # Load, send what is due; returns the number of reminders sent
+        now = tasks.now_epoch() if now is None else now
+        with self.pool.connection() as conn:
+            with self._lock:
+                if self._loaded is None or self._loaded[0] < now + LEAD + self.horizon / 2:
+                    self._load(conn, now)
+                if time.monotonic() - self._polled >= POLL_SECONDS:
+                    self._poll_new(conn, now)
+                    self._polled = time.monotonic()
+                if self._verifying:
+                    self._poll_returned(conn, now)
+                due = self._due(now)
+
+            sent = 0
+            for fire_at, task_id, kind, deadline in due:
+                sent += self._deliver(conn, fire_at, task_id, kind, deadline, now)
+        self.sent += sent
+        return sent
+
+    def next_wakeup(self, now):
+        # Seconds until the next reminder or poll, whichever is sooner
+        with self._lock:
+            next_fire = self._heap[0][0] - now if self._heap else POLL_SECONDS
+        return max(0.0, min(next_fire, POLL_SECONDS))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as exc:
+                # Database busy, sink misconfigured: report and keep going
+                print(f"Reminder scheduler error: {exc!r}", file=sys.stderr)
+            self._wake.wait(self.next_wakeup(tasks.now_epoch()))
+            self._wake.clear()
+
+
+if __name__ == "__main__":
+    # Standalone scheduler process: python reminders.py
+    pool = storage.ConnectionPool()
+    scheduler = ReminderScheduler(pool).start()
+    print(f"Reminder scheduler running on {pool.path}, sending to {SINK}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
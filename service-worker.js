@@ -1,22 +1,16 @@
 // Service Worker for Photo-Verified Todo App
-const CACHE_NAME = 'todo-verify-v1';
+// Generated into static/ by assets.py, which fills in the build hash, the
+// fingerprinted asset list and the task API URL; serve
+// static/service-worker.js, not this file
+const CACHE_NAME = 'todo-verify-__BUILD_HASH__';
 
 // Files to cache
-const filesToCache = [
-  '/',
-  '/index.html',
-  '/static/css/main.css',
-  '/manifest.json',
-  '/icons/icon-72x72.png',
-  '/icons/icon-96x96.png',
-  '/icons/icon-128x128.png',
-  '/icons/icon-144x144.png',
-  '/icons/icon-152x152.png',
-  '/icons/icon-192x192.png',
-  '/icons/icon-384x384.png',
-  '/icons/icon-512x512.png',
-  // Add other static assets as needed
-];
+const filesToCache = [/* __PRECACHE_URLS__ */];
+
+// Task API responses are kept in their own cache, across builds, so the
+// last lists fetched are still there offline
+const API_CACHE = 'todo-verify-api';
+const API_URL = new URL('__API_URL__', self.location.origin).href;
 
 // Install event - cache core assets
 self.addEventListener('install', event => {
@@ -38,7 +32,7 @@ self.addEventListener('activate', event => {
   event.waitUntil(
     caches.keys().then(keyList => {
       return Promise.all(keyList.map(key => {
-        if (key !== CACHE_NAME) {
+        if (key !== CACHE_NAME && key !== API_CACHE) {
           console.log('[ServiceWorker] Removing old cache', key);
           return caches.delete(key);
         }
@@ -51,14 +45,47 @@ self.addEventListener('activate', event => {
   );
 });
 
+// Stale-while-revalidate: answer from the cache at once when possible and
+// refresh it in the background. The API marks responses no-cache, so the
+// refresh is a conditional request that comes back 304 while nothing changed.
+function staleWhileRevalidate(event) {
+  return caches.open(API_CACHE).then(cache =>
+    cache.match(event.request).then(cached => {
+      const network = fetch(event.request).then(response => {
+        if (response.status === 200) {
+          cache.put(event.request, response.clone());
+        }
+        return response;
+      }).catch(error => {
+        if (cached) {
+          return cached;
+        }
+        throw error;
+      });
+
+      if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+      }
+      return network;
+    })
+  );
+}
+
 // Fetch event - serve from cache or network
 self.addEventListener('fetch', event => {
+  // Task API reads, which may live on another origin
+  if (event.request.method === 'GET' && event.request.url.startsWith(API_URL + 'tasks/')) {
+    event.respondWith(staleWhileRevalidate(event));
+    return;
+  }
+
   // Skip cross-origin requests
   if (!event.request.url.startsWith(self.location.origin)) {
     return;
   }
 
-  // Skip API calls which shouldn't be cached
+  // Skip other API calls, which shouldn't be cached
   if (event.request.url.includes('/api/') || 
       event.request.url.includes('groq.com')) {
     return;
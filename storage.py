@@ -0,0 +1,493 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+# Database location can be overridden for tests and deployments
+DB_PATH = os.environ.get("TODO_DB_PATH", "todo.db")
+
+# How long a connection waits on a locked database before raising
+BUSY_TIMEOUT_MS = 5000
+
+# Upper bound on connections handed out to Streamlit script threads
+POOL_SIZE = int(os.environ.get("TODO_DB_POOL_SIZE", "8"))
+
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("TODO_DB_POOL_TIMEOUT", "30"))
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    # Raised like "database is locked", so callers that retry on a busy
+    # database retry on an exhausted pool as well
+    pass
+
+
+# Schema migrations, applied in order and recorded in PRAGMA user_version.
+# Never edit a released migration; append a new one instead.
+def _migrate_create_tasks(conn):
+    c = conn.cursor()
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        title TEXT,
+        description TEXT,
+        created_at TIMESTAMP,
+        deadline TIMESTAMP,
+        completed_at TIMESTAMP,
+        status TEXT,
+        verification_result TEXT
+    )
+    ''')
+
+    # Databases created before deadlines existed lack the column
+    c.execute("PRAGMA table_info(tasks)")
+    columns = [column[1] for column in c.fetchall()]
+    if 'deadline' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN deadline TIMESTAMP")
+
+
+def _migrate_list_indexes(conn):
+    # Back the pending (by deadline) and completed (by completion time) lists
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline ON tasks (status, deadline)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_completed_at ON tasks (status, completed_at)")
+
+
+def _to_epoch(value):
+    # Values written by older versions are naive local-time datetimes
+    # serialised by sqlite3's default adapter ("YYYY-MM-DD HH:MM:SS[.ffffff]")
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (ValueError, TypeError):
+        return None
+
+
+def _migrate_epoch_timestamps(conn):
+    # Rewrite created_at, deadline and completed_at as integer epoch
+    # seconds. Unparseable values become NULL, which the app already shows
+    # as "no deadline".
+    rows = conn.execute(
+        "SELECT id, created_at, deadline, completed_at FROM tasks "
+        "WHERE typeof(created_at) NOT IN ('integer', 'null') "
+        "OR typeof(deadline) NOT IN ('integer', 'null') "
+        "OR typeof(completed_at) NOT IN ('integer', 'null')"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE tasks SET created_at=?, deadline=?, completed_at=? WHERE id=?",
+        [(_to_epoch(created), _to_epoch(deadline), _to_epoch(completed), task_id)
+         for task_id, created, deadline, completed in rows]
+    )
+
+
+def _migrate_verification_cache(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS verification_cache (
+        image_sha256 TEXT NOT NULL,
+        description TEXT NOT NULL,
+        model TEXT NOT NULL,
+        result TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        last_used_at INTEGER NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (image_sha256, description, model)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verification_cache_last_used ON verification_cache (last_used_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verification_cache_created ON verification_cache (created_at)")
+
+
+def _migrate_verification_jobs(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS verification_jobs (
+        id INTEGER PRIMARY KEY,
+        task_id INTEGER NOT NULL REFERENCES tasks (id),
+        task_description TEXT,
+        image BLOB,
+        submitted_at INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at INTEGER NOT NULL,
+        result TEXT,
+        error TEXT,
+        updated_at INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verification_jobs_ready ON verification_jobs (status, next_attempt_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verification_jobs_task ON verification_jobs (task_id)")
+
+
+def _migrate_structured_verdicts(conn):
+    # Verdict codes are 'verified' / 'not_verified'; confidence is 0..1
+    # and only known for structured answers
+    c = conn.cursor()
+    c.execute("PRAGMA table_info(tasks)")
+    columns = [column[1] for column in c.fetchall()]
+    if 'verdict' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN verdict TEXT")
+    if 'confidence' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN confidence REAL")
+
+    # Backfill from the free-text results, which lead with VERIFIED or
+    # NOT VERIFIED (possibly after markdown emphasis)
+    c.execute('''
+    UPDATE tasks SET verdict = CASE
+        WHEN ltrim(upper(verification_result), ' *#_' || char(10)) LIKE 'NOT VERIFIED%' THEN 'not_verified'
+        WHEN ltrim(upper(verification_result), ' *#_' || char(10)) LIKE 'VERIFIED%' THEN 'verified'
+        WHEN instr(upper(verification_result), 'NOT VERIFIED') > 0 THEN 'not_verified'
+        WHEN instr(upper(verification_result), 'VERIFIED') > 0 THEN 'verified'
+        ELSE 'not_verified'
+    END
+    WHERE verification_result IS NOT NULL AND verdict IS NULL
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_verdict ON tasks (verdict, status, completed_at)")
+
+
+def _migrate_row_versions(conn):
+    # Every change to a task bumps its version, so rendered rows can be
+    # cached on (id, version). The trigger only fires for updates that
+    # leave version alone, which also stops it re-triggering itself.
+    c = conn.cursor()
+    c.execute("PRAGMA table_info(tasks)")
+    columns = [column[1] for column in c.fetchall()]
+    if 'version' not in columns:
+        c.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS tasks_bump_version AFTER UPDATE ON tasks
+    FOR EACH ROW WHEN NEW.version = OLD.version
+    BEGIN
+        UPDATE tasks SET version = OLD.version + 1 WHERE id = NEW.id;
+    END
+    ''')
+
+
+def _migrate_evidence(conn):
+    # Evidence photos live on disk in evidence.EvidenceStore, addressed by
+    # sha256; a photo shared by several tasks is stored once
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS evidence (
+        id INTEGER PRIMARY KEY,
+        task_id INTEGER NOT NULL REFERENCES tasks (id),
+        sha256 TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        UNIQUE (task_id, sha256)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_evidence_sha256 ON evidence (sha256)")
+
+
+def _migrate_evidence_hashes(conn):
+    # Perceptual hash of each evidence photo, and the band index that
+    # triage.py searches for reused photos
+    c = conn.cursor()
+    c.execute("PRAGMA table_info(evidence)")
+    columns = [column[1] for column in c.fetchall()]
+    if 'phash' not in columns:
+        c.execute("ALTER TABLE evidence ADD COLUMN phash INTEGER")
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS evidence_bands (
+        band INTEGER NOT NULL,
+        value INTEGER NOT NULL,
+        evidence_id INTEGER NOT NULL REFERENCES evidence (id),
+        PRIMARY KEY (band, value, evidence_id)
+    ) WITHOUT ROWID
+    ''')
+
+
+_FTS_INSERT_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+    INSERT INTO tasks_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+END
+'''
+
+
+def _migrate_task_search(conn):
+    # External-content FTS5 index over task titles and descriptions. The
+    # triggers keep it in step with tasks; status changes and version bumps
+    # do not touch it. Prefix indexes up to six characters keep
+    # search-as-you-type queries from merging every term with a common
+    # prefix; positions are not stored since searches are word-based.
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4 5 6',
+        detail=column
+    )
+    ''')
+    conn.execute(_FTS_INSERT_TRIGGER)
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, title, description) VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        INSERT INTO tasks_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+    END
+    ''')
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+def _migrate_reminders(conn):
+    # Reminders already sent by reminders.ReminderScheduler, keyed by the
+    # deadline they were for
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reminders_sent (
+        task_id INTEGER NOT NULL REFERENCES tasks (id),
+        kind TEXT NOT NULL,
+        deadline INTEGER NOT NULL,
+        sent_at INTEGER NOT NULL,
+        PRIMARY KEY (task_id, kind, deadline)
+    )
+    ''')
+
+
+def _count_trigger(event, condition=""):
+    return f'''
+    CREATE TRIGGER IF NOT EXISTS tasks_count_{event.lower()} AFTER {event} ON tasks
+    FOR EACH ROW {condition}
+    BEGIN
+        UPDATE change_counters SET counter = counter + 1 WHERE name = 'tasks';
+    END
+    '''
+
+
+def _migrate_change_counters(conn):
+    # A counter per table, bumped by every insert, update and delete, so a
+    # reader can tell whether anything changed with one primary key lookup.
+    # Updates are counted on the version bump, which happens exactly once
+    # per updated row (see _migrate_row_versions).
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        counter INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute("INSERT OR IGNORE INTO change_counters (name, counter) VALUES ('tasks', 0)")
+    conn.execute(_count_trigger("INSERT"))
+    conn.execute(_count_trigger("DELETE"))
+    conn.execute(_count_trigger("UPDATE", "WHEN NEW.version != OLD.version"))
+
+
+_VERDICT_INSERT_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS tasks_verdict_insert AFTER INSERT ON tasks
+WHEN NEW.status = 'completed' AND NEW.verdict IS NOT NULL
+BEGIN
+    INSERT INTO verdict_counts (verdict, count) VALUES (NEW.verdict, 1)
+    ON CONFLICT (verdict) DO UPDATE SET count = count + 1;
+END
+'''
+
+
+def _migrate_verdict_counts(conn):
+    # Completed tasks per verdict, kept up to date by triggers, so the
+    # Completed tab's totals are read without counting rows
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS verdict_counts (
+        verdict TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT OR REPLACE INTO verdict_counts (verdict, count)
+    SELECT verdict, COUNT(*) FROM tasks WHERE status = 'completed' AND verdict IS NOT NULL GROUP BY verdict
+    ''')
+    conn.execute(_VERDICT_INSERT_TRIGGER)
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tasks_verdict_delete AFTER DELETE ON tasks
+    WHEN OLD.status = 'completed' AND OLD.verdict IS NOT NULL
+    BEGIN
+        UPDATE verdict_counts SET count = count - 1 WHERE verdict = OLD.verdict;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS tasks_verdict_update AFTER UPDATE OF status, verdict ON tasks
+    WHEN OLD.status IS NOT NEW.status OR OLD.verdict IS NOT NEW.verdict
+    BEGIN
+        UPDATE verdict_counts SET count = count - 1
+        WHERE OLD.status = 'completed' AND verdict = OLD.verdict;
+        INSERT INTO verdict_counts (verdict, count)
+        SELECT NEW.verdict, 1 WHERE NEW.status = 'completed' AND NEW.verdict IS NOT NULL
+        ON CONFLICT (verdict) DO UPDATE SET count = count + 1;
+    END
+    ''')
+
+
+MIGRATIONS = [
+    _migrate_create_tasks,
+    _migrate_list_indexes,
+    _migrate_epoch_timestamps,
+    _migrate_verification_cache,
+    _migrate_verification_jobs,
+    _migrate_structured_verdicts,
+    _migrate_row_versions,
+    _migrate_evidence,
+    _migrate_evidence_hashes,
+    _migrate_task_search,
+    _migrate_reminders,
+    _migrate_change_counters,
+    _migrate_verdict_counts,
+]
+
+
+@contextmanager
+def deferred_insert_triggers(conn):
+    # For bulk inserts into tasks, inside the caller's transaction: the
+    # per-row search index, change counter and verdict count insert triggers
+    # are dropped, and their work is done once for all new rows on exit,
+    # several times faster than row by row. Other connections never see the
+    # triggers missing; if the block raises, rolling back restores them.
+    if not conn.in_transaction:
+        raise RuntimeError("deferred_insert_triggers() needs an open transaction")
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+    conn.execute("DROP TRIGGER tasks_fts_insert")
+    conn.execute("DROP TRIGGER tasks_count_insert")
+    conn.execute("DROP TRIGGER tasks_verdict_insert")
+    yield
+    conn.execute(
+        "INSERT INTO tasks_fts (rowid, title, description) SELECT id, title, description FROM tasks WHERE id > ?",
+        (last_id,)
+    )
+    conn.execute(
+        "UPDATE change_counters SET counter = counter + (SELECT COUNT(*) FROM tasks WHERE id > ?) WHERE name = 'tasks'",
+        (last_id,)
+    )
+    conn.execute(
+        "INSERT INTO verdict_counts (verdict, count) "
+        "SELECT verdict, COUNT(*) FROM tasks WHERE id > ? AND status = 'completed' AND verdict IS NOT NULL "
+        "GROUP BY verdict ON CONFLICT (verdict) DO UPDATE SET count = count + excluded.count",
+        (last_id,)
+    )
+    conn.execute(_FTS_INSERT_TRIGGER)
+    conn.execute(_count_trigger("INSERT"))
+    conn.execute(_VERDICT_INSERT_TRIGGER)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    # An up-to-date database needs no write lock; shards are opened often
+    if schema_version(conn) == len(MIGRATIONS):
+        return
+    # BEGIN IMMEDIATE takes the write lock up front so that two processes
+    # starting at once cannot both apply the same migration
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(conn)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def connect(path=DB_PATH):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+    )
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    # WAL makes NORMAL durable against application crashes and avoids an
+    # fsync on every commit
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return metrics.instrument_connection(conn)
+
+
+class ConnectionPool:
+    # A fixed-size pool of SQLite connections shared by every script thread.
+    # Connections are created lazily up to `size` and reused afterwards;
+    # callers beyond that wait up to `timeout` seconds for one to be
+    # returned, then raise PoolTimeout.
+    #
+    # Borrowing is reentrant per thread: a thread that already holds a
+    # connection (a page rendering a fragment, reading the verification
+    # cache or writing through a backend) gets the same one back, so nested
+    # borrows never wait on the pool and cannot deadlock it. A connection
+    # in the middle of a transaction is not shared this way; the nested
+    # borrower gets its own.
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._held = threading.local()
+        self._created = 0
+        self._all = []
+
+        # Run migrations once, before any connection is handed out
+        conn = self._open()
+        migrate(conn)
+        self._idle.put(conn)
+
+    def _open(self):
+        conn = connect(self.path)
+        self._all.append(conn)
+        self._created += 1
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                return self._open()
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(
+                f"No database connection free after {self.timeout:g}s ({self.size} in use)"
+            ) from None
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._held, "conn", None)
+        if held is not None and not held.in_transaction:
+            try:
+                yield held
+            finally:
+                # Whatever the nested borrower left open is undone; the
+                # outer borrower still owns the connection
+                if held.in_transaction:
+                    held.rollback()
+            return
+
+        conn = self._acquire()
+        self._held.conn = conn
+        try:
+            yield conn
+        finally:
+            self._held.conn = held
+            # Never return a connection with a dangling transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._created = 0
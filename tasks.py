@@ -0,0 +1,254 @@
+# Task queries used by the Streamlit pages.
+#
+# Lists are read with keyset ("seek") pagination: each page is fetched by
+# continuing from the sort key of the last row of the previous page instead
+# of using OFFSET. Together with the (status, deadline) and
+# (status, completed_at) indexes this keeps the cost of a page independent
+# of how many tasks the table holds.
+#
+# Timestamps are stored as integer epoch seconds. Urgency buckets, on-time
+# flags and display strings are computed by SQLite in the same query, so
+# rendering a row needs no date parsing in Python.
+import re
+import sqlite3
+import time
+
+PAGE_SIZE = 25
+
+# Bucket boundaries in seconds before the deadline
+URGENT_SECONDS = 3600
+TODAY_SECONDS = 24 * 3600
+
+
+def _local(column):
+    return f"datetime({column}, 'unixepoch', 'localtime')"
+
+
+# Pending rows: id, title, description, created, deadline (epoch),
+# deadline text, bucket, seconds remaining, row version. Takes `now` four
+# times.
+PENDING_COLUMNS = f"""id, title, description, {_local("created_at")}, deadline, {_local("deadline")},
+    CASE
+        WHEN deadline IS NULL THEN 'none'
+        WHEN deadline < ? THEN 'overdue'
+        WHEN deadline < ? + {URGENT_SECONDS} THEN 'urgent'
+        WHEN deadline < ? + {TODAY_SECONDS} THEN 'today'
+        ELSE 'later'
+    END,
+    deadline - ?, version"""
+
+# Completed rows: id, title, description, deadline text, completed text,
+# verification result, verdict, confidence, on-time flag (NULL when
+# unknown), seconds late (negative when early), row version.
+COMPLETED_COLUMNS = f"""id, title, description, {_local("deadline")}, {_local("completed_at")}, verification_result,
+    verdict, confidence,
+    CASE
+        WHEN deadline IS NULL OR completed_at IS NULL THEN NULL
+        ELSE completed_at <= deadline
+    END,
+    completed_at - deadline, version"""
+
+# Rows for the JSON API: stored values only, nothing relative to the current
+# time, so a response stays valid until the table changes
+PENDING_RECORD_COLUMNS = "id, title, description, created_at, deadline, version"
+COMPLETED_RECORD_COLUMNS = """id, title, description, created_at, deadline, completed_at,
+    verification_result, verdict, confidence, version"""
+
+
+def now_epoch():
+    return int(time.time())
+
+
+def _segments(column, cursor, descending):
+    # The sort order is split into two contiguous runs: rows whose sort key
+    # is NULL (ordered by id) and rows with a value (ordered by value, id).
+    # SQLite puts NULLs first when ascending and last when descending. Each
+    # run is a plain index range, unlike a single OR-ed seek condition, so
+    # this returns the (WHERE fragment, params) of the runs still to be read
+    # after `cursor`, a (value, id) pair, in order.
+    op = "<" if descending else ">"
+    nulls = f" AND {column} IS NULL", ()
+    values = f" AND {column} IS NOT NULL", ()
+
+    if cursor is not None:
+        value, row_id = cursor
+        if value is None:
+            nulls = f" AND {column} IS NULL AND id {op} ?", (row_id,)
+        else:
+            values = f" AND ({column}, id) {op} (?, ?)", (value, row_id)
+
+    if descending:
+        if cursor is not None and cursor[0] is None:
+            return [nulls]
+        return [values, nulls]
+
+    if cursor is not None and cursor[0] is not None:
+        return [values]
+    return [nulls, values]
+
+
+def _page(conn, columns, status, sort_column, descending, after, limit, column_params=(), filters=()):
+    direction = "DESC" if descending else "ASC"
+
+    # Fetch one extra row to learn whether another page follows. The sort
+    # key is selected as a trailing column so the cursor for the next page
+    # can be read off the last row; callers expect `id` to come first.
+    # `filters` are extra (column, value) equality conditions.
+    rows = []
+    filter_sql = "".join(f" AND {column}=?" for column, _ in filters)
+    filter_params = tuple(value for _, value in filters)
+    for where, params in _segments(sort_column, after, descending):
+        rows += conn.execute(
+            f"SELECT {columns}, {sort_column} FROM tasks WHERE status=?{filter_sql}{where} "
+            f"ORDER BY {sort_column} {direction}, id {direction} LIMIT ?",
+            (*column_params, status, *filter_params, *params, limit + 1 - len(rows)),
+        ).fetchall()
+        if len(rows) > limit:
+            break
+
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = (rows[-1][-1], rows[-1][0])
+
+    return [row[:-1] for row in rows], cursor
+
+
+def pending_page(conn, after=None, limit=PAGE_SIZE, now=None):
+    now = now_epoch() if now is None else now
+    return _page(
+        conn, PENDING_COLUMNS, "pending", "deadline", False, after, limit,
+        column_params=(now,) * 4,
+    )
+
+
+def completed_page(conn, after=None, limit=PAGE_SIZE, verdict=None):
+    filters = [("verdict", verdict)] if verdict is not None else []
+    return _page(conn, COMPLETED_COLUMNS, "completed", "completed_at", True, after, limit, filters=filters)
+
+
+def pending_records(conn, after=None, limit=PAGE_SIZE):
+    return _page(conn, PENDING_RECORD_COLUMNS, "pending", "deadline", False, after, limit)
+
+
+def completed_records(conn, after=None, limit=PAGE_SIZE, verdict=None):
+    filters = [("verdict", verdict)] if verdict is not None else []
+    return _page(conn, COMPLETED_RECORD_COLUMNS, "completed", "completed_at", True, after, limit, filters=filters)
+
+
+def change_counter(conn, name="tasks"):
+    # Bumped by triggers on every change to the table
+    return conn.execute("SELECT counter FROM change_counters WHERE name=?", (name,)).fetchone()[0]
+
+
+def verdict_counts(conn):
+    # {verdict: count} over completed tasks, kept by triggers in
+    # verdict_counts
+    return dict(conn.execute("SELECT verdict, count FROM verdict_counts WHERE count > 0").fetchall())
+
+
+def search_query(text):
+    # FTS5 query for search-as-you-type: every word must appear, the last
+    # one possibly still being typed (a prefix). None when there is nothing
+    # to search for. Words are quoted, so FTS5 syntax is taken literally.
+    # They are split as the unicode61 tokenizer splits them, at underscores
+    # too: a quoted word the tokenizer would split is a phrase, which the
+    # detail=column index cannot match.
+    words = re.findall(r"[^\W_]+", text or "")
+    if not words:
+        return None
+    return " ".join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+
+
+def search_pending(conn, text, limit=PAGE_SIZE):
+    # (id, title) pairs of the newest pending tasks matching `text`. Walking
+    # the index in rowid order stops after `limit` pending matches; ranking
+    # by relevance would score every match first.
+    query = search_query(text)
+    if query is None:
+        return []
+    try:
+        return conn.execute(
+            "SELECT t.id, t.title FROM tasks_fts f JOIN tasks t ON t.id = f.rowid "
+            "WHERE tasks_fts MATCH ? AND t.status='pending' ORDER BY f.rowid DESC LIMIT ?",
+            (query, limit)
+        ).fetchall()
+    except sqlite3.OperationalError as exc:
+        # Input the tokenizer still splits differently; no matches rather
+        # than a broken page. A busy database is not swallowed.
+        if "fts5" not in str(exc):
+            raise
+        return []
+
+
+def pending_choices(conn, limit=PAGE_SIZE, include_id=None, search=None):
+    # (id, title) pairs for the Complete Task selector: the newest matches
+    # for `search` when given, otherwise the soonest deadlines
+    if search_query(search) is not None:
+        choices = search_pending(conn, search, limit)
+    else:
+        choices, _ = _page(conn, "id, title", "pending", "deadline", False, None, limit)
+
+    if include_id is not None and all(task_id != include_id for task_id, _ in choices):
+        row = conn.execute(
+            "SELECT id, title FROM tasks WHERE id=? AND status='pending'", (include_id,)
+        ).fetchone()
+        if row is not None:
+            choices.insert(0, row)
+
+    return choices
+
+
+def get_task(conn, task_id, now=None):
+    # description, deadline (epoch), deadline text, seconds remaining
+    now = now_epoch() if now is None else now
+    return conn.execute(
+        f"SELECT description, deadline, {_local('deadline')}, deadline - ? FROM tasks WHERE id=?",
+        (now, task_id),
+    ).fetchone()
+
+
+def add_task(conn, title, description, deadline, now=None, commit=True):
+    # Returns the new task's id
+    now = now_epoch() if now is None else now
+    c = conn.execute(
+        "INSERT INTO tasks (title, description, created_at, deadline, status) VALUES (?, ?, ?, ?, ?)",
+        (title, description, now, deadline, "pending")
+    )
+    if commit:
+        conn.commit()
+    return c.lastrowid
+
+
+def complete_task(conn, task_id, verification_result, completed_at=None, verdict=None, confidence=None, commit=True):
+    completed_at = now_epoch() if completed_at is None else completed_at
+    conn.execute(
+        "UPDATE tasks SET status=?, completed_at=?, verification_result=?, verdict=?, confidence=? WHERE id=?",
+        ("completed", completed_at, verification_result, verdict, confidence, task_id)
+    )
+    if commit:
+        conn.commit()
+
+
+def reopen_task(conn, task_id, commit=True):
+    # Back to pending, with whatever a broken-off verification recorded
+    # cleared
+    conn.execute(
+        "UPDATE tasks SET status='pending', completed_at=NULL, verification_result=NULL, verdict=NULL, "
+        "confidence=NULL WHERE id=?",
+        (task_id,)
+    )
+    if commit:
+        conn.commit()
+
+
+def complete_tasks(conn, completions, commit=True):
+    # (task_id, verification_result, completed_at, verdict, confidence)
+    # tuples, written in one transaction
+    conn.executemany(
+        "UPDATE tasks SET status='completed', completed_at=?, verification_result=?, verdict=?, confidence=? WHERE id=?",
+        [(completed_at, result, verdict, confidence, task_id)
+         for task_id, result, completed_at, verdict, confidence in completions]
+    )
+    if commit:
+        conn.commit()
@@ -0,0 +1,186 @@
+# Local checks run on an evidence photo before it is sent to the model.
+#
+# A few Pillow statistics computed on a small grayscale copy catch photos
+# that cannot show anything (tiny, nearly black or white, featureless), and
+# a 64-bit difference hash finds photos already submitted for another task.
+# Such uploads are answered locally with a not-verified verdict, saving a
+# model call.
+#
+# Hashes of stored evidence are indexed in evidence_bands: the hash is cut
+# into BANDS bands of 16 bits. Two hashes at most MAX_DISTANCE bits apart
+# have some band differing in at most MAX_DISTANCE // BANDS bits, so a
+# lookup probes each band's value and its neighbours within that many bit
+# flips, and only evidence found that way is compared in full.
+import math
+from itertools import combinations
+import os
+import threading
+from collections import namedtuple
+from io import BytesIO
+
+from metrics import span
+from verifier import NOT_VERIFIED, Verification
+
+# Photos smaller than this on their shorter side are rejected
+MIN_SIDE = int(os.environ.get("TRIAGE_MIN_SIDE", "64"))
+
+# Mean brightness (0-255) outside this range means a black or white frame
+MIN_BRIGHTNESS = int(os.environ.get("TRIAGE_MIN_BRIGHTNESS", "12"))
+MAX_BRIGHTNESS = int(os.environ.get("TRIAGE_MAX_BRIGHTNESS", "243"))
+
+# Shannon entropy of the grayscale histogram, in bits (0-8); a blank wall or
+# lens cap scores close to zero
+MIN_ENTROPY = float(os.environ.get("TRIAGE_MIN_ENTROPY", "2.0"))
+
+# Hashes at most this many bits apart are the same photo
+MAX_DISTANCE = int(os.environ.get("TRIAGE_MAX_DISTANCE", "6"))
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+PROBE_RADIUS = MAX_DISTANCE // BANDS
+
+# Statistics are computed on a copy this small
+SAMPLE_SIDE = 64
+
+ImageStats = namedtuple("ImageStats", ["width", "height", "brightness", "entropy", "phash"])
+
+# `verification` is None when the model has to decide
+Triage = namedtuple("Triage", ["verification", "stats", "reused_task_id"])
+
+_stats_lock = threading.Lock()
+_stats = {"checked": 0, "avoided": 0, "rejected": 0, "reused": 0}
+
+
+def difference_hash(image):
+    # 64-bit dHash of a grayscale image: one bit per horizontally adjacent
+    # pixel pair of a 9x8 copy, set when brightness increases
+    from PIL import Image
+
+    pixels = list(image.resize((9, 8), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            value = (value << 1) | (pixels[row * 9 + column + 1] > left)
+    return value
+
+
+def inspect(image_bytes):
+    # Pillow is loaded on first use, not at app startup
+    from PIL import Image, ImageOps
+
+    with span("triage.inspect"), Image.open(BytesIO(image_bytes)) as image:
+        width, height = image.size
+        # JPEGs can be decoded straight at a fraction of their size
+        image.draft("L", (SAMPLE_SIDE * 2, SAMPLE_SIDE * 2))
+        image = ImageOps.exif_transpose(image).convert("L")
+        sample = image.resize((SAMPLE_SIDE, SAMPLE_SIDE), Image.BILINEAR)
+
+        histogram = sample.histogram()
+        total = sum(histogram)
+        brightness = sum(level * count for level, count in enumerate(histogram)) / total
+        entropy = -sum(count / total * math.log2(count / total) for count in histogram if count)
+
+        return ImageStats(width, height, brightness, entropy, difference_hash(image))
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def bands(phash):
+    # (band number, band value) pairs of a hash
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (phash >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+
+def probes(value):
+    # A band value and every value within PROBE_RADIUS bit flips of it
+    values = [value]
+    for flips in range(1, PROBE_RADIUS + 1):
+        for bits in combinations(range(BAND_BITS), flips):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def index_hash(conn, evidence_id, phash):
+    # Record stored evidence in the band index; the caller commits
+    conn.execute("UPDATE evidence SET phash=? WHERE id=?", (_signed(phash), evidence_id))
+    conn.executemany(
+        "INSERT OR IGNORE INTO evidence_bands (band, value, evidence_id) VALUES (?, ?, ?)",
+        [(band, value, evidence_id) for band, value in bands(phash)]
+    )
+
+
+def find_reuse(conn, phash, task_id):
+    # Closest (task id, distance) among other tasks' evidence, or None
+    conditions = []
+    params = []
+    for band, value in bands(phash):
+        values = probes(value)
+        conditions.append(f"(b.band = ? AND b.value IN ({', '.join('?' * len(values))}))")
+        params += [band, *values]
+    candidates = conn.execute(
+        "SELECT DISTINCT e.task_id, e.phash FROM evidence_bands b JOIN evidence e ON e.id = b.evidence_id "
+        f"WHERE ({' OR '.join(conditions)}) AND e.task_id != ?",
+        (*params, task_id)
+    ).fetchall()
+
+    best = None
+    for other_task_id, other_hash in candidates:
+        distance = bin((phash ^ other_hash) & ((1 << 64) - 1)).count("1")
+        if distance <= MAX_DISTANCE and (best is None or distance < best[1]):
+            best = (other_task_id, distance)
+    return best
+
+
+def triage(conn, image_bytes, task_id):
+    return screen(conn, inspect(image_bytes), task_id)
+
+
+def screen(conn, stats, task_id):
+    # The verdict for a photo already inspected. Only this part reads the
+    # database, so a caller holding a write lock inspects photos first.
+    reason = None
+    if min(stats.width, stats.height) < MIN_SIDE:
+        reason = f"The photo is too small to show anything ({stats.width}x{stats.height} pixels)."
+    elif stats.brightness < MIN_BRIGHTNESS:
+        reason = "The photo is almost completely black."
+    elif stats.brightness > MAX_BRIGHTNESS:
+        reason = "The photo is almost completely white."
+    elif stats.entropy < MIN_ENTROPY:
+        reason = "The photo is nearly blank and shows no detail."
+    if reason is not None:
+        return Triage(Verification(NOT_VERIFIED, None, reason), stats, None)
+
+    with span("triage.lookup"):
+        reuse = find_reuse(conn, stats.phash, task_id)
+    if reuse is not None:
+        reason = f"The photo matches evidence already submitted for another task (task {reuse[0]})."
+        return Triage(Verification(NOT_VERIFIED, None, reason), stats, reuse[0])
+
+    return Triage(None, stats, None)
+
+
+def remember(conn, evidence_id, result):
+    # Index a submitted photo so later reuse is caught; the caller commits
+    if evidence_id is not None:
+        index_hash(conn, evidence_id, result.stats.phash)
+
+
+def record(result):
+    # Count a submitted photo's triage outcome
+    with _stats_lock:
+        _stats["checked"] += 1
+        if result.verification is not None:
+            _stats["avoided"] += 1
+            _stats["reused" if result.reused_task_id is not None else "rejected"] += 1
+
+
+def triage_stats():
+    with _stats_lock:
+        return dict(_stats)
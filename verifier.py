@@ -0,0 +1,294 @@
+import asyncio
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import images
+from groq_client import get_async_client, get_client, run_async
+from metrics import span
+
+# Vision model used for all verifications
+MODEL = "llama-3.2-11b-vision-preview"
+
+# Upper bound on the length of the model's answer
+MAX_COMPLETION_TOKENS = 512
+
+# Rough token cost of one image, used to pace requests against the
+# tokens-per-minute budget until the API reports actual usage
+IMAGE_TOKENS = int(os.environ.get("GROQ_IMAGE_TOKENS", "1500"))
+
+
+# Verdict codes stored in tasks.verdict
+VERIFIED = "verified"
+NOT_VERIFIED = "not_verified"
+
+Verification = namedtuple("Verification", ["verdict", "confidence", "reason"])
+
+
+def verification_prompt(task_description):
+    # The verdict key comes first so streamed answers settle it early
+    return f"You are a task verification assistant. Your job is to verify if the uploaded image shows evidence that the described task has been completed. Be strict but fair in your assessment.\n\nDoes this image show evidence that the following task has been completed? Task: {task_description}\n\nRespond with a JSON object with exactly these keys, in this order: \"verdict\": \"VERIFIED\" if the image clearly shows the task has been completed, or \"NOT VERIFIED\" if the evidence is insufficient or unclear; \"confidence\": a number from 0 to 1 for how sure you are; \"reason\": a brief explanation of your reasoning."
+
+
+# Groq Llama API setup
+def estimate_tokens(task_description):
+    # About four characters per token for the prompt text
+    return len(verification_prompt(task_description)) // 4 + IMAGE_TOKENS + MAX_COMPLETION_TOKENS
+
+
+def verification_messages(prepared, task_description):
+    # Convert the preprocessed image to base64 for API
+    base64_image = base64.b64encode(prepared.data).decode('utf-8')
+    
+    # Note: Llama 3.2 doesn't support system messages with image inputs
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text", 
+                    "text": verification_prompt(task_description)
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{prepared.mime_type};base64,{base64_image}",
+                    },
+                },
+            ],
+        }
+    ]
+
+
+def request_verification(prepared, task_description):
+    with span("groq.completion"):
+        chat_completion = get_client().chat_completion(
+            estimate_tokens(task_description),
+            model=MODEL,
+            max_completion_tokens=MAX_COMPLETION_TOKENS,
+            response_format={"type": "json_object"},
+            messages=verification_messages(prepared, task_description)
+        )
+    
+    return chat_completion.choices[0].message.content
+
+
+def verify_task_completion(image_bytes, task_description, cache=None):
+    # Downscale and re-encode in a worker thread while the cache is checked
+    prepared = images.preprocess_async(image_bytes)
+
+    # Identical resubmissions (reruns, double clicks) are answered from the
+    # cache without another model round trip
+    if cache is not None:
+        result = cache.get(image_bytes, task_description, MODEL)
+        if result is not None:
+            prepared.cancel()
+            return result
+
+    result = request_verification(prepared.result(), task_description)
+
+    if cache is not None:
+        cache.put(image_bytes, task_description, MODEL, result)
+    return result
+
+
+async def verify_task_completion_async(image_bytes, task_description, cache=None):
+    # Same steps as verify_task_completion, run on the groq_client event
+    # loop; blocking work (image preprocessing, SQLite) stays on threads
+    prepared = asyncio.wrap_future(images.preprocess_async(image_bytes))
+
+    if cache is not None:
+        result = await asyncio.to_thread(cache.get, image_bytes, task_description, MODEL)
+        if result is not None:
+            prepared.cancel()
+            return result
+
+    messages = verification_messages(await prepared, task_description)
+    with span("groq.completion"):
+        chat_completion = await get_async_client().chat_completion(
+            estimate_tokens(task_description),
+            model=MODEL,
+            max_completion_tokens=MAX_COMPLETION_TOKENS,
+            response_format={"type": "json_object"},
+            messages=messages
+        )
+    result = chat_completion.choices[0].message.content
+
+    if cache is not None:
+        await asyncio.to_thread(cache.put, image_bytes, task_description, MODEL, result)
+    return result
+
+
+def verify_batch(items, cache=None):
+    # Verify (image_bytes, task_description) pairs concurrently, bounded by
+    # the async client's semaphore. Returns one entry per item, in order:
+    # the verification text, or the exception that item raised.
+    async def run():
+        return await asyncio.gather(
+            *(verify_task_completion_async(image_bytes, description, cache=cache)
+              for image_bytes, description in items),
+            return_exceptions=True
+        )
+
+    return run_async(run())
+
+
+_VERDICT_CODES = {"VERIFIED": VERIFIED, "NOT VERIFIED": NOT_VERIFIED}
+
+# `"verdict": "..."` as soon as its closing quote has streamed in
+_VERDICT_FIELD = re.compile(r'"verdict"\s*:\s*"([^"]*)"')
+
+# The reason string so far, possibly still unterminated
+_REASON_FIELD = re.compile(r'"reason"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+_stream_stats_lock = threading.Lock()
+_stream_stats = {"streams": 0, "ttft_total": 0.0, "verdict_total": 0.0}
+
+
+def _legacy_verdict(text):
+    # Free-text answers led with VERIFIED / NOT VERIFIED; note that the
+    # substring "VERIFIED" also occurs in "NOT VERIFIED"
+    upper = text.upper()
+    head = upper.lstrip(" \n*#_")
+    if head.startswith("NOT VERIFIED"):
+        return NOT_VERIFIED
+    if head.startswith("VERIFIED"):
+        return VERIFIED
+    return VERIFIED if "VERIFIED" in upper and "NOT VERIFIED" not in upper else NOT_VERIFIED
+
+
+def _strip_fences(text):
+    # Some answers wrap the JSON in a markdown code block
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1]
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+def parse_verification(text):
+    # Structured answers are JSON; anything else (cached answers from the
+    # free-text prompt, a model ignoring the format) falls back to reading
+    # the verdict off the text, with the whole text as the reason
+    try:
+        data = json.loads(_strip_fences(text))
+        verdict = _VERDICT_CODES[str(data["verdict"]).strip().upper()]
+    except (ValueError, TypeError, KeyError):
+        return Verification(_legacy_verdict(text), None, text)
+
+    try:
+        confidence = min(1.0, max(0.0, float(data.get("confidence"))))
+    except (TypeError, ValueError):
+        confidence = None
+    return Verification(verdict, confidence, str(data.get("reason") or ""))
+
+
+def detect_verdict(text):
+    # Verdict code once the streamed `text` settles it, else None
+    match = _VERDICT_FIELD.search(text)
+    if match:
+        return _VERDICT_CODES.get(match.group(1).strip().upper(), NOT_VERIFIED)
+
+    head = text.lstrip(" \n*#_`").upper()
+    if head.startswith("NOT VERIFIED"):
+        return NOT_VERIFIED
+    if head.startswith("VERIFIED"):
+        return VERIFIED
+    return None
+
+
+def partial_reason(text):
+    # Displayable explanation from a partial answer
+    match = _REASON_FIELD.search(text)
+    if match:
+        raw = match.group(1)
+        # Drop a dangling escape before decoding the JSON string
+        if raw.endswith("\\") and not raw.endswith("\\\\"):
+            raw = raw[:-1]
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
+    if text.lstrip().startswith(("{", "`")):
+        return ""
+    return text
+
+
+def stream_verification(image_bytes, task_description, cache=None):
+    # Yields ("verdict", code) as soon as the streamed tokens settle it,
+    # ("text", explanation so far) as the answer arrives and finally
+    # ("done", (full_text, metrics)). metrics holds time to first token and
+    # time to verdict in seconds, None for cached answers. JSON mode cannot
+    # be combined with streaming, so the prompt alone asks for JSON here
+    # and the verdict is read off the partial answer.
+    started = time.perf_counter()
+    prepared = images.preprocess_async(image_bytes)
+
+    if cache is not None:
+        result = cache.get(image_bytes, task_description, MODEL)
+        if result is not None:
+            prepared.cancel()
+            verification = parse_verification(result)
+            yield "verdict", verification.verdict
+            yield "text", verification.reason
+            yield "done", (result, {"ttft": None, "time_to_verdict": None})
+            return
+
+    stream = get_client().stream_chat_completion(
+        estimate_tokens(task_description),
+        model=MODEL,
+        max_completion_tokens=MAX_COMPLETION_TOKENS,
+        messages=verification_messages(prepared.result(), task_description)
+    )
+
+    text = ""
+    verdict = None
+    metrics = {"ttft": None, "time_to_verdict": None}
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content or ""
+        if not piece:
+            continue
+
+        if metrics["ttft"] is None:
+            metrics["ttft"] = time.perf_counter() - started
+        text += piece
+
+        if verdict is None:
+            verdict = detect_verdict(text)
+            if verdict is not None:
+                metrics["time_to_verdict"] = time.perf_counter() - started
+                yield "verdict", verdict
+        yield "text", partial_reason(text)
+
+    if verdict is None:
+        verdict = parse_verification(text).verdict
+        metrics["time_to_verdict"] = time.perf_counter() - started
+        yield "verdict", verdict
+
+    with _stream_stats_lock:
+        _stream_stats["streams"] += 1
+        _stream_stats["ttft_total"] += metrics["ttft"] or 0.0
+        _stream_stats["verdict_total"] += metrics["time_to_verdict"]
+
+    if cache is not None:
+        cache.put(image_bytes, task_description, MODEL, text)
+    yield "done", (text, metrics)
+
+
+def stream_stats():
+    # Averages over streamed (uncached) verifications in this process
+    with _stream_stats_lock:
+        count = _stream_stats["streams"]
+        if not count:
+            return {"streams": 0, "avg_ttft": None, "avg_time_to_verdict": None}
+        return {
+            "streams": count,
+            "avg_ttft": _stream_stats["ttft_total"] / count,
+            "avg_time_to_verdict": _stream_stats["verdict_total"] / count,
+        }
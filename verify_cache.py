@@ -0,0 +1,92 @@
+import hashlib
+import os
+import threading
+import time
+
+# Cached verdicts expire after this many seconds
+CACHE_TTL = int(os.environ.get("VERIFY_CACHE_TTL", str(7 * 24 * 3600)))
+
+# At most this many verdicts are kept; the least recently used go first
+CACHE_SIZE = int(os.environ.get("VERIFY_CACHE_SIZE", "1000"))
+
+
+def normalize_description(task_description):
+    # Case and whitespace differences do not change what is being verified
+    return " ".join((task_description or "").lower().split())
+
+
+def cache_key(image_bytes, task_description, model):
+    return (
+        hashlib.sha256(image_bytes).hexdigest(),
+        normalize_description(task_description),
+        model,
+    )
+
+
+class VerificationCache:
+    # Persistent cache of model verdicts keyed by (sha256 of the image,
+    # normalized task description, model name), stored in the
+    # verification_cache table next to tasks.
+
+    def __init__(self, pool, ttl=CACHE_TTL, max_entries=CACHE_SIZE):
+        self.pool = pool
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, image_bytes, task_description, model):
+        key = cache_key(image_bytes, task_description, model)
+        now = int(time.time())
+
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT result FROM verification_cache "
+                "WHERE image_sha256=? AND description=? AND model=? AND created_at > ?",
+                (*key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE verification_cache SET last_used_at=?, hits=hits+1 "
+                    "WHERE image_sha256=? AND description=? AND model=?",
+                    (now, *key)
+                )
+                conn.commit()
+
+        self._count(row is not None)
+        return row[0] if row is not None else None
+
+    def put(self, image_bytes, task_description, model, result):
+        key = cache_key(image_bytes, task_description, model)
+        now = int(time.time())
+
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO verification_cache "
+                "(image_sha256, description, model, result, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (*key, result, now, now)
+            )
+            # Drop expired entries, then everything past the size bound in
+            # least-recently-used order
+            conn.execute("DELETE FROM verification_cache WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM verification_cache WHERE rowid IN ("
+                "SELECT rowid FROM verification_cache ORDER BY last_used_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def stats(self):
+        with self.pool.connection() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM verification_cache").fetchone()[0]
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}